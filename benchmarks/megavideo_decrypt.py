@@ -0,0 +1,130 @@
+'''
+    Check the Megavideo decrypter against the original implementation.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Usage: python megavideo_decrypt.py [number of responses]
+
+    Decrypts random videolink.php responses (including zero and over-long un
+    values) with both megavideo.Megavideo_Decrypt and the string based
+    implementation it replaced, prints how many results differ and how long
+    each took. Exits with status 1 if any differ.
+'''
+
+import os
+import random
+import re
+import sys
+import time
+
+#make megavideo (and the t0mm0.common it uses) importable without XBMC
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(_root, 'script.module.t0mm0.common', 'lib'))
+sys.path.insert(0, os.path.join(_root, 'script.module.urlresolver', 'lib',
+                                'urlresolver', 'plugins', 'lib'))
+import megavideo
+
+
+class ReferenceDecrypt:
+    '''The original Megavideo_Decrypt, kept as the reference.'''
+
+    def __init__(self, XML_FILE):
+        self.XML_FILE = XML_FILE
+        self.setKeys()
+
+        tobin = self.hex2bin(self.un)
+        keys = []
+        index = 0
+
+        while (index < 384):
+            self.k1 = ((int(self.k1) * 11) + 77213) % 81371
+            self.k2 = ((int(self.k2) * 17) + 92717) % 192811
+            keys.append((int(self.k1) + int(self.k2)) % 128)
+            index += 1
+
+        index = 256
+
+        while (index >= 0):
+            val1 = keys[index]
+            mod  = index%128
+            val2 = tobin[val1]
+            tobin[val1] = tobin[mod]
+            tobin[mod] = val2
+            index -= 1
+
+        index = 0
+        while(index<128):
+            tobin[index] = int(tobin[index]) ^ int(keys[index+256]) & 1
+            index += 1
+
+        self.decrypted = self.bin2hex(tobin)
+
+    def setKeys(self):
+        self.k1 = re.findall('k1="([0-9]+)"',self.XML_FILE,re.I)[0].replace("+"," ")
+        self.k2 = re.findall('k2="([0-9]+)"',self.XML_FILE,re.I)[0].replace("+"," ")
+        self.un = re.findall('un="(.+?)"',self.XML_FILE,re.I)[0].replace("+"," ")
+
+    def getDecrypted(self):
+        return self.decrypted
+
+    def hex2bin(self,val):
+        bin_array = []
+        string =  bin(int(val, 16))[2:].zfill(128)
+        for value in string:
+            bin_array.append(value)
+        return bin_array
+
+    def bin2hex(self,val):
+        string = str("")
+        for char in val:
+            string+=str(char)
+        return "%x" % int(string, 2)
+
+
+def responses(count):
+    '''Returns ``count`` random videolink.php style responses.'''
+    ret = []
+    for i in range(count):
+        bits = random.choice((128, 128, 128, 0, 64, 136))
+        un = '%x' % random.getrandbits(bits) if bits else '0'
+        ret.append('<ROW un="%s" k1="%d" k2="%d" s="1"/>' %
+                   (un, random.randint(0, 200000), random.randint(0, 200000)))
+    return ret
+
+
+def timed(decrypter, xml_files):
+    start = time.time()
+    results = [decrypter(xml).getDecrypted() for xml in xml_files]
+    return results, time.time() - start
+
+
+if __name__ == '__main__':
+    count = 3000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    xml_files = responses(count)
+
+    expected, ref_time = timed(ReferenceDecrypt, xml_files)
+    results, new_time = timed(megavideo.Megavideo_Decrypt, xml_files)
+    mismatches = [xml for xml, a, b in zip(xml_files, expected, results)
+                  if a != b]
+    many = megavideo.decrypt_many(xml_files)
+    mismatches += [xml for xml, a, b in zip(xml_files, expected, many)
+                   if a != b]
+
+    print '%d responses, %d mismatches' % (count, len(mismatches))
+    for xml in mismatches[:10]:
+        print '    ' + xml
+    print 'reference: %.3fs, megavideo: %.3fs' % (ref_time, new_time)
+    sys.exit(mismatches and 1 or 0)
@@ -0,0 +1,121 @@
+'''
+    Local HTTP server used by the benchmarks in this directory.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import BaseHTTPServer
+import gzip
+import os
+import SocketServer
+import StringIO
+import sys
+import threading
+
+#make t0mm0.common importable without installing the addon
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'script.module.t0mm0.common', 'lib'))
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Answers GET and HEAD requests with an HTML page and POST requests with 
+    the posted form data, keeping connections alive.
+    
+    ``/<size>`` returns a page of ``size`` bytes which is gzipped if the 
+    client accepts it, ``/plain/<size>`` is never compressed. ``/`` is a 1KB
+    page.
+    '''
+    
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    _pages = {}
+    
+    def log_message(self, *args):
+        pass
+        
+        
+    def do_GET(self, head=False):
+        path = self.path.strip('/').split('/')
+        plain = path[0] == 'plain'
+        if plain:
+            path = path[1:]
+        try:
+            size = int(path[0] or 1024)
+        except ValueError:
+            self._reply('not found', status='404 Not Found')
+            return
+        accept = self.headers.getheader('accept-encoding', '')
+        compress = not plain and 'gzip' in accept
+        self._reply(self._page(size, compress), head, compress)
+        
+        
+    def do_HEAD(self):
+        self.do_GET(head=True)
+        
+        
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        self._reply(self.rfile.read(length))
+        
+        
+    def _page(self, size, compress):
+        '''Returns the (cached) body of a page.'''
+        key = (size, compress)
+        if key not in self._pages:
+            words = ['word%d' % (i % 997) for i in range(size / 6 + 1)]
+            page = '<html><body>%s</body></html>' % ' '.join(words)
+            page = page[:size - 14] + '</body></html>'
+            if compress:
+                s = StringIO.StringIO()
+                g = gzip.GzipFile(fileobj=s, mode='wb')
+                g.write(page)
+                g.close()
+                page = s.getvalue()
+            self._pages[key] = page
+        return self._pages[key]
+        
+        
+    def _reply(self, body, head=False, compressed=False, status='200 OK'):
+        #send everything in one write so timings aren't skewed by nagle
+        response = ['HTTP/1.1 ' + status, 'Content-Type: text/html', 
+                    'Content-Length: %d' % len(body)]
+        if compressed:
+            response.append('Content-Encoding: gzip')
+        response = '\r\n'.join(response + ['', ''])
+        if not head:
+            response += body
+        self.wfile.write(response)
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start(handler=_Handler):
+    '''
+    Start a server on a free local port in a background thread.
+    
+    Kwargs:
+        handler (class): The request handler class to use.
+        
+    Returns:
+        The base URL of the server, eg. ``'http://127.0.0.1:12345'``.
+    '''
+    server = _Server(('127.0.0.1', 0), handler)
+    t = threading.Thread(target=server.serve_forever)
+    t.setDaemon(True)
+    t.start()
+    return 'http://127.0.0.1:%d' % server.server_address[1]
@@ -0,0 +1,190 @@
+'''
+    Throughput benchmark for t0mm0.common.net.Net on a local HTTP server.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Usage: python throughput.py [options]
+    
+    Runs http_GET, http_POST and http_HEAD against gzipped and plain pages of
+    several sizes with 1 to 64 threads calling them at once. For each case 
+    the requests per second, latency percentiles and peak memory use are 
+    written out as JSON, so results can be compared between releases.
+    
+    The peak memory only ever goes up during a process, so each case is run
+    in a process of its own and its ``case_peak_memory_kb`` is the peak 
+    resident memory of that process (a fresh interpreter plus the case). The
+    test server runs in the main process.
+'''
+
+import optparse
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import server
+from t0mm0.common.net import Net
+
+THREADS = (1, 2, 4, 8, 16, 32, 64)
+SIZES = (1024, 16384, 262144)
+METHODS = ('GET', 'POST', 'HEAD')
+
+
+def peak_memory():
+    '''Returns the peak resident memory of this process in KB.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def run(call, threads, duration):
+    '''
+    Call ``call`` repeatedly from ``threads`` threads for ``duration`` 
+    seconds.
+    
+    Returns:
+        A dictionary of results.
+    '''
+    latencies = []
+    errors = []
+    deadline = time.time() + duration
+    
+    def worker():
+        times = []
+        while time.time() < deadline:
+            start = time.time()
+            try:
+                call()
+            except Exception, e:
+                errors.append(e)
+            times.append(time.time() - start)
+        latencies.extend(times)
+        
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    return {'requests': len(latencies),
+            'errors': len(errors),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'latency_ms': dict(('p%d' % p, 
+                                round(percentile(latencies, p) * 1000, 3))
+                               for p in (50, 90, 95, 99)),
+            'case_peak_memory_kb': peak_memory()}
+
+
+def run_case(options):
+    '''
+    Run the single case given by ``--case`` against the server at ``--base``
+    and print its results as JSON. This is what each child process does.
+    '''
+    method, path, threads = options.case.split(':')
+    url = options.base + path
+    net = Net()
+    net.set_transport(options.transport)
+    form = {'key': 'value' * 20}
+    call = {'GET': lambda: net.http_GET(url).content,
+            'POST': lambda: net.http_POST(url, form).content,
+            'HEAD': lambda: net.http_HEAD(url)}[method]
+    #warm up the connection pool
+    run(call, int(threads), 0.1)
+    print json.dumps(run(call, int(threads), options.duration))
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-d', '--duration', type='float', default=2.0,
+                      help='seconds to run each case for (default 2)')
+    parser.add_option('-t', '--threads', default=','.join(map(str, THREADS)),
+                      help='comma separated thread counts')
+    parser.add_option('-m', '--methods', default=','.join(METHODS),
+                      help='comma separated methods to run')
+    parser.add_option('--transport', default='urllib2',
+                      help='Net transport to use (urllib2 or httplib)')
+    parser.add_option('-o', '--output', 
+                      help='file to write the JSON results to (default '
+                           'stdout)')
+    #used to run a single case in a child process
+    parser.add_option('--case', help=optparse.SUPPRESS_HELP)
+    parser.add_option('--base', help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    
+    if options.case:
+        run_case(options)
+        return
+    
+    base = server.start()
+    threads = [int(t) for t in options.threads.split(',')]
+    
+    cases = []
+    for method in options.methods.upper().split(','):
+        for size in SIZES:
+            for compressed in (True, False):
+                if method == 'POST' and (size != SIZES[0] or not compressed):
+                    #the response is the posted data whatever the page
+                    continue
+                path = '/%d' % size
+                if not compressed:
+                    path = '/plain' + path
+                for n in threads:
+                    child = subprocess.Popen(
+                                [sys.executable, os.path.abspath(__file__),
+                                 '--case', '%s:%s:%d' % (method, path, n),
+                                 '--base', base, 
+                                 '--duration', str(options.duration),
+                                 '--transport', options.transport],
+                                stdout=subprocess.PIPE)
+                    result = json.loads(child.communicate()[0])
+                    result.update({'method': method, 'threads': n})
+                    if method != 'POST':
+                        result.update({'size': size, 'gzip': compressed})
+                    cases.append(result)
+                    sys.stderr.write('%s %s: %d threads, %.0f req/s\n' % 
+                                     (method, path, n, 
+                                      result['requests_per_second']))
+    
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'transport': options.transport,
+               'duration': options.duration,
+               'cases': cases}
+    output = json.dumps(results, indent=1, sort_keys=True)
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            f.write(output)
+        finally:
+            f.close()
+    else:
+        print output
+    
+
+if __name__ == '__main__':
+    main()
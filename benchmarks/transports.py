@@ -0,0 +1,88 @@
+'''
+    Compare the Net transports on a local HTTP server.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Usage: python transports.py [requests per thread]
+    
+    For each transport (see Net.set_transport()) and number of threads, 
+    prints the requests per second and the median and 95th percentile 
+    latency of http_GET.
+'''
+
+import sys
+import threading
+import time
+
+import server
+from t0mm0.common.net import Net
+
+TRANSPORTS = ('urllib2', 'httplib')
+THREADS = (1, 4, 16)
+
+
+def run(net, url, threads, requests):
+    '''
+    Make ``requests`` GETs from each of ``threads`` threads.
+    
+    Returns:
+        A tuple of the total time taken and a sorted list of latencies.
+    '''
+    latencies = []
+    
+    def worker():
+        times = []
+        for i in range(requests):
+            start = time.time()
+            net.http_GET(url)
+            times.append(time.time() - start)
+        latencies.extend(times)
+    
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    latencies.sort()
+    return time.time() - start, latencies
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def main():
+    requests = 500
+    if len(sys.argv) > 1:
+        requests = int(sys.argv[1])
+    url = server.start() + '/'
+    net = Net()
+    print '%-10s %7s %10s %10s %10s' % ('transport', 'threads', 'req/s', 
+                                         'p50 ms', 'p95 ms')
+    for transport in TRANSPORTS:
+        net.set_transport(transport)
+        #warm up the connection pool
+        run(net, url, max(THREADS), 5)
+        for threads in THREADS:
+            elapsed, latencies = run(net, url, threads, requests)
+            print '%-10s %7d %10.0f %10.2f %10.2f' % (
+                transport, threads, len(latencies) / elapsed, 
+                percentile(latencies, 50) * 1000, 
+                percentile(latencies, 95) * 1000)
+    net.set_transport('urllib2')
+    
+
+if __name__ == '__main__':
+    main()
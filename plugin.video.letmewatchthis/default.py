@@ -68,35 +68,63 @@ elif mode == 'browse':
     letter = addon.queries.get('letter', False)
     section = addon.queries.get('section', '')
     if letter:        
-        html = '> >> <'
         if genre == 'All':
             genre = ''
         if letter == 'All':
             letter = ''
-        page = 0
-        while html.find('> >> <') > -1:
-            page += 1
-            url = '%s/?letter=%s&sort=alphabet&page=%s&genre=%s&%s' % (
-                                         base_url, letter, page, genre, section)
-            print url
-            try:
-                addon.log_debug('fetching %s' % url)
-                html = net.http_GET(url).content
-            except urllib2.URLError, e:
-                html = ''
-                addon.log_error('got http error %d fetching %s' %
-                                (e.code, web_url))
-
-            r = re.search('number_movies_result">([0-9,]+)', html)
-            if r:
-                total = int(r.group(1).replace(',', ''))
-            else:
-                total = 0
-                
-            r = 'class="index_item.+?href="(.+?)".+?src="(.+?)".+?' + \
-                'alt="Watch (.+?)"'
+        page_url = '%s/?letter=%s&sort=alphabet&page=%%d&genre=%s&%s' % (
+                                               base_url, letter, genre, section)
+        try:
+            url = page_url % 1
+            addon.log_debug('fetching %s' % url)
+            html = net.http_GET(url).content
+        except urllib2.URLError, e:
+            html = ''
+            addon.log_error('got http error %d fetching %s' % (e.code, url))
+
+        count = re.search('number_movies_result">([0-9,]+)', html)
+        if count:
+            total = int(count.group(1).replace(',', ''))
+        else:
+            total = 0
+        
+        #work out how many pages there are from the first one and fetch the 
+        #rest of them in parallel
+        pages = [html]
+        per_page = len(re.findall('class="index_item', html))
+        if html.find('> >> <') > -1 and total <= per_page:
+            #the count is missing or can't be right, so just follow the 
+            #next page links one at a time
+            if not count:
+                addon.log_error('number of results not found on %s' % url)
+            page = 1
+            while html.find('> >> <') > -1:
+                page += 1
+                url = page_url % page
+                try:
+                    addon.log_debug('fetching %s' % url)
+                    html = net.http_GET(url).content
+                except urllib2.URLError, e:
+                    html = ''
+                    addon.log_error('got http error %s fetching %s' % (e, url))
+                pages.append(html)
+        elif html.find('> >> <') > -1 and per_page:
+            last_page = (total + per_page - 1) / per_page
+            urls = [page_url % page for page in range(2, last_page + 1)]
+            addon.log_debug('fetching %d more pages' % len(urls))
+            for url, response, error in net.http_GET_many(urls):
+                if error:
+                    addon.log_error('got http error %s fetching %s' %
+                                    (error, url))
+                    pages.append('')
+                else:
+                    pages.append(response.content)
+
+        r = 'class="index_item.+?href="(.+?)".+?src="(.+?)".+?' + \
+            'alt="Watch (.+?)"'
+        urls = []
+        for html in pages:
             regex = re.finditer(r, html, re.DOTALL)
-            urls = []
             for s in regex:
                 url, thumb, title = s.groups()
                 if url not in urls:
@@ -16,23 +16,134 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import cgi
 import cookielib
-import gzip
+import copy
+import httplib
+import base64
+import os
+import Queue
 import re
+import socket
 import StringIO
+import threading
+import time
 import urllib
 import urllib2
+import urlparse
+import zlib
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+#counters shared by all Net instances, see Net.get_stats()
+_stats = {}
+_stats_lock = threading.Lock()
+
+def _count(key, value=1):
+    '''Add ``value`` to the named counter in the shared stats.'''
+    _stats_lock.acquire()
+    try:
+        _stats[key] = _stats.get(key, 0) + value
+    finally:
+        _stats_lock.release()
+
+#per request timing traces, see Net.add_trace_hook()
+_trace_hooks = []
+_tracing = False
+_local = threading.local()
+
+def _trace_add(key, seconds):
+    '''Add ``seconds`` to a phase of the current thread's request trace.'''
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace[key] = trace.get(key, 0) + seconds
+
+#archive used to record or replay all requests, see Net.set_archive()
+_archive = None
+
+#backend used to send all requests, see Net.set_transport()
+_transport = None
+
+#True if the installed opener sends http requests through a proxy
+_proxied = False
+
+def _urlopen(req):
+    '''Send a request with the transport in use.'''
+    return _transport.open(req)
+
+#bandwidth and request accounting by host and tag, see Net.get_accounting()
+_accounts = {'hosts': {}, 'tags': {}}
+#the same counters since they were last saved, see Net.save_accounting()
+_unsaved_accounts = {'hosts': {}, 'tags': {}}
+_accounts_lock = threading.Lock()
+
+def _usage_add(key, value):
+    '''Add ``value`` to a counter in the current thread's request usage.'''
+    usage = getattr(_local, 'usage', None)
+    if usage is not None:
+        usage[key] = usage.get(key, 0) + value
+        
+        
+def _account(host, tag, usage):
+    '''Add the usage of a finished request to the accounting counters.'''
+    _accounts_lock.acquire()
+    try:
+        for accounts in (_accounts, _unsaved_accounts):
+            for group, name in (('hosts', host), ('tags', tag)):
+                counters = accounts[group].setdefault(name, {})
+                for key, value in usage.items():
+                    counters[key] = counters.get(key, 0) + value
+    finally:
+        _accounts_lock.release()
+
+_meta_charset_re = re.compile('<meta\s+http-equiv="Content-Type"\s+' +
+                              'content="(?:.+?);\s+charset=(.+?)"', 
+                              re.IGNORECASE)
+
 
 class HeadRequest(urllib2.Request):
     '''A Request class that sends HEAD requests'''
     def get_method(self):
         return 'HEAD'
 
+
+class _RedirectHandler(urllib2.HTTPRedirectHandler):
+    '''
+    A :class:`urllib2.HTTPRedirectHandler` which keeps HEAD requests as HEAD
+    requests when following a redirect, so the target isn't downloaded, and
+    hands back the redirect itself for requests with ``follow_redirects`` set
+    to ``False`` (see :meth:`Net.http_GET`).
+    '''
+    
+    def http_error_302(self, req, fp, code, msg, headers):
+        if not getattr(req, 'follow_redirects', True):
+            return fp
+        return urllib2.HTTPRedirectHandler.http_error_302(self, req, fp, code,
+                                                          msg, headers)
+    
+    http_error_301 = http_error_303 = http_error_307 = http_error_302
+    
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new = urllib2.HTTPRedirectHandler.redirect_request(self, req, fp, code,
+                                                           msg, headers, 
+                                                           newurl)
+        if new is not None and req.get_method() == 'HEAD':
+            new = HeadRequest(new.get_full_url(), headers=new.headers,
+                              origin_req_host=new.get_origin_req_host(),
+                              unverifiable=True)
+        return new
+
 class Net:
     '''
     This class wraps :mod:`urllib2` and provides an easy way to make http
-    requests while taking care of cookies, proxies, gzip compression and 
-    character encoding.
+    requests while taking care of cookies, proxies, gzip/deflate compression 
+    and character encoding. 
+    
+    HTTP connections are kept alive and shared between all :class:`Net` 
+    instances, so repeated requests to the same host skip connection setup.
+    Host name lookups are cached too (see :class:`DNSCache`).
     
     Example::
     
@@ -47,6 +158,7 @@ class Net:
     _user_agent = 'Mozilla/5.0 (X11; Linux i686) AppleWebKit/535.1 ' + \
                   '(KHTML, like Gecko) Chrome/13.0.782.99 Safari/535.1'
     _http_debug = False
+    _hedge_policy = None
     
     
     def __init__(self, cookie_file='', proxy='', user_agent='', 
@@ -134,31 +246,362 @@ class Net:
         return self._user_agent
 
 
+    def set_hedge_policy(self, policy):
+        '''
+        Turn on hedged requests for :meth:`http_GET`, :meth:`http_GET_search`
+        and :meth:`http_HEAD`. 
+        
+        With hedging on, if a request hasn't received its response headers 
+        within a delay worked out from recent response times for that host, a 
+        duplicate request is sent and whichever answers first is used. 
+        :meth:`http_POST` is never hedged.
+        
+        Args:
+            policy (:class:`HedgePolicy`): The policy to use, or ``None`` to 
+            turn hedging off.
+        '''
+        self._hedge_policy = policy
+        
+        
+    def get_hedge_policy(self):
+        '''Returns the :class:`HedgePolicy` in use or ``None``.'''
+        return self._hedge_policy
+        
+        
+    def set_host_limit(self, host, rate=0, burst=1, max_connections=0):
+        '''
+        Limit how fast requests may be made to a host. Limits are shared by
+        all :class:`Net` instances in this process, and requests which have to
+        wait are let through in the order they arrived.
+        
+        A limit on ``example.com`` also applies to ``www.example.com`` and any
+        other subdomain, and all of them share the same allowance.
+        
+        Example::
+        
+            #no more than one request a second and two at once to putlocker
+            net.set_host_limit('putlocker.com', rate=1, max_connections=2)
+        
+        Args:
+            host (str): The host name to limit.
+            
+        Kwargs:
+            rate (float): Maximum average number of requests per second, or 
+            ``0`` for no rate limit.
+            
+            burst (int): Number of requests which may be made at once before 
+            ``rate`` kicks in.
+            
+            max_connections (int): Maximum number of requests in progress at 
+            the same time, or ``0`` for no limit.
+        
+        If both ``rate`` and ``max_connections`` are ``0`` any limit on 
+        ``host`` is removed.
+        '''
+        host = host.lower()
+        _host_limits_lock.acquire()
+        try:
+            if rate or max_connections:
+                _host_limits[host] = _HostLimit(rate, burst, max_connections)
+            elif host in _host_limits:
+                del _host_limits[host]
+        finally:
+            _host_limits_lock.release()
+            
+            
+    def set_dns_cache(self, cache):
+        '''
+        Replace the :class:`DNSCache` used to look up host names. The cache is
+        shared by all :class:`Net` instances in this process.
+        
+        Args:
+            cache (:class:`DNSCache`): The cache to use, or ``None`` to look 
+            up every host name with the system resolver.
+        '''
+        global _dns_cache
+        _dns_cache = cache
+        _pool.clear()
+        
+        
+    def get_dns_cache(self):
+        '''Returns the :class:`DNSCache` in use or ``None``.'''
+        return _dns_cache
+        
+        
+    def set_tracing(self, enabled):
+        '''
+        Turn timing traces on or off for all :class:`Net` instances. 
+        
+        When tracing is on (or any trace hooks have been added with 
+        :meth:`add_trace_hook`), each request records how long it spent in 
+        each phase and the :class:`HttpResponse` it returns has a 
+        :attr:`~HttpResponse.timings` dictionary containing the number of 
+        seconds spent:
+        
+        * ``queue``: waiting for a host limit (see :meth:`set_host_limit`)
+        * ``dns``: looking up host names
+        * ``connect``: opening connections
+        * ``ttfb``: between sending the request and receiving the response
+          headers (the server's think time plus one round trip)
+        * ``read``: reading the body from the connection
+        * ``decompress``: decompressing the body
+        * ``decode``: converting the body to unicode (only added once 
+          :attr:`HttpResponse.content` has been used)
+        * ``total``: from starting the request until the body was read
+        
+        Phases which didn't happen (such as ``connect`` when a kept alive 
+        connection was reused) are left out. Timings are only recorded on 
+        the calling thread, so hedged requests only record ``queue`` and 
+        ``total``. When tracing is off nothing is recorded.
+        
+        Args:
+            enabled (bool): ``True`` to record timings.
+        '''
+        global _tracing
+        _tracing = enabled
+        
+        
+    def add_trace_hook(self, hook):
+        '''
+        Add a function to be called with the timings of every request made by
+        any :class:`Net` instance (see :meth:`set_tracing`). Adding a hook 
+        turns tracing on.
+        
+        Example::
+        
+            def log_timings(url, timings):
+                addon.log_debug('%s took %.3fs' % (url, timings['total']))
+            net.add_trace_hook(log_timings)
+        
+        Args:
+            hook (function): Called with the URL and the timings dictionary
+            once the body of the response has been read. Exceptions raised by
+            the hook are ignored.
+        '''
+        if hook not in _trace_hooks:
+            _trace_hooks.append(hook)
+            
+            
+    def remove_trace_hook(self, hook):
+        '''Remove a function added with :meth:`add_trace_hook`.'''
+        if hook in _trace_hooks:
+            _trace_hooks.remove(hook)
+        
+        
+    def set_accounting_tag(self, tag):
+        '''
+        Set the tag which requests made from the current thread are counted 
+        under in :meth:`get_accounting`. :mod:`urlresolver` sets this to the
+        name of the resolver plugin in use.
+        
+        Args:
+            tag (str): The tag, or ``''`` for untagged requests.
+        '''
+        _local.tag = tag
+        
+        
+    def get_accounting_tag(self):
+        '''Returns the tag set by :meth:`set_accounting_tag` in this thread.'''
+        return getattr(_local, 'tag', '')
+        
+        
+    def get_accounting(self):
+        '''
+        Returns a snapshot of the request and bandwidth counters kept for all
+        :class:`Net` instances in this process.
+        
+        The result is a dictionary with two keys, ``'hosts'`` and ``'tags'``,
+        each of which maps a host name (or tag set by 
+        :meth:`set_accounting_tag`) to a dictionary of counters:
+        
+        * ``requests``: number of requests made
+        * ``bytes_sent``: bytes of request line, headers and form data sent
+        * ``bytes_received``: bytes of response headers and body received
+        * ``compressed_bytes``: size of compressed bodies as received
+        * ``decompressed_bytes``: size of those bodies after decompression
+        * ``cache_hits``: host name lookups answered by the DNS cache and 
+          requests sent on a reused keep-alive connection
+        '''
+        _accounts_lock.acquire()
+        try:
+            return dict((group, dict((name, dict(counters)) 
+                                     for name, counters in names.items()))
+                        for group, names in _accounts.items())
+        finally:
+            _accounts_lock.release()
+            
+            
+    def save_accounting(self, path):
+        '''
+        Adds the usage counted since the last save (or since the process 
+        started) to the totals already saved in a JSON file. This means the 
+        file holds the totals across every process which has saved to it. 
+        The counters returned by :meth:`get_accounting` are not changed.
+        
+        Args:
+            path (str): Full path to the file to save to. It is created if it
+            doesn't exist.
+        '''
+        _accounts_lock.acquire()
+        try:
+            snapshot = dict(_unsaved_accounts)
+            _unsaved_accounts['hosts'] = {}
+            _unsaved_accounts['tags'] = {}
+        finally:
+            _accounts_lock.release()
+            
+        totals = {'hosts': {}, 'tags': {}}
+        if os.path.exists(path):
+            try:
+                f = open(path)
+                try:
+                    totals.update(json.load(f))
+                finally:
+                    f.close()
+            except (IOError, ValueError):
+                pass
+        for group, names in snapshot.items():
+            for name, counters in names.items():
+                total = totals[group].setdefault(name, {})
+                for key, value in counters.items():
+                    total[key] = total.get(key, 0) + value
+        f = open(path, 'w')
+        try:
+            json.dump(totals, f)
+        finally:
+            f.close()
+            
+            
+    def reset_accounting(self):
+        '''
+        Sets all counters returned by :meth:`get_accounting` to zero. Usage
+        which hasn't been saved yet is still added to the file by the next
+        :meth:`save_accounting`.
+        '''
+        _accounts_lock.acquire()
+        try:
+            _accounts['hosts'] = {}
+            _accounts['tags'] = {}
+        finally:
+            _accounts_lock.release()
+            
+            
+    def set_archive(self, archive):
+        '''
+        Record every request made by any :class:`Net` instance into an 
+        :class:`HttpArchive`, or answer every request from one without using
+        the network, depending on the archive's ``mode``. 
+        
+        Hedging (see :meth:`set_hedge_policy`) is turned off while an archive
+        is set.
+        
+        Args:
+            archive (:class:`HttpArchive`): The archive to use, or ``None`` to 
+            go back to normal.
+        '''
+        global _archive
+        _archive = archive
+        
+        
+    def get_archive(self):
+        '''Returns the :class:`HttpArchive` in use or ``None``.'''
+        return _archive
+        
+        
+    def set_transport(self, transport):
+        '''
+        Choose how requests are sent. This is shared by all :class:`Net` 
+        instances in this process.
+        
+        ``'urllib2'`` (the default) sends requests through the full 
+        :mod:`urllib2` handler chain. ``'httplib'`` sends them straight to the
+        shared connection pool, handling cookies and redirects itself, which 
+        saves a lot of per-request overhead. It doesn't support proxies or 
+        HTTP authentication, so while a proxy is set (with :meth:`set_proxy` 
+        or the ``http_proxy`` environment variable) requests go through 
+        :mod:`urllib2` anyway, as do HTTPS requests.
+        
+        ``benchmarks/transports.py`` compares the two on a local server.
+        
+        Args:
+            transport (str): ``'urllib2'`` or ``'httplib'``.
+        '''
+        global _transport
+        if transport == 'httplib':
+            _transport = _HttplibTransport(int(self._http_debug))
+        elif transport == 'urllib2':
+            _transport = _UrllibTransport()
+        else:
+            raise ValueError('unknown transport: %s' % transport)
+        
+        
+    def get_transport(self):
+        '''Returns the name of the transport in use.'''
+        return _transport.name
+        
+        
+    def get_stats(self):
+        '''
+        Returns a dictionary of counters shared by all :class:`Net` instances 
+        in this process. 
+        
+        ``decompress_errors`` counts responses whose gzip or deflate encoded 
+        body could not be decompressed. ``hedged_requests`` counts duplicate
+        requests sent by a :class:`HedgePolicy` and ``hedge_wins`` how many of
+        them answered first. ``limited_requests`` counts requests to hosts 
+        with a limit set by :meth:`set_host_limit` and ``limiter_wait_time`` 
+        is the total number of seconds they spent waiting for their turn.
+        ``dns_lookups`` counts host name lookups sent to the resolver and 
+        ``dns_cache_hits`` lookups answered by the :class:`DNSCache`.
+        ``preconnects`` counts connections opened by :meth:`preconnect`.
+        ``replayed`` counts requests answered by an :class:`HttpArchive` and
+        ``replay_misses`` requests it had no recording for.
+        '''
+        _stats_lock.acquire()
+        try:
+            return dict(_stats)
+        finally:
+            _stats_lock.release()
+            
+
+    def reset_stats(self):
+        '''Sets all counters returned by :meth:`get_stats` back to zero.'''
+        _stats_lock.acquire()
+        try:
+            _stats.clear()
+        finally:
+            _stats_lock.release()
+
+
     def _update_opener(self):
         '''
         Builds and installs a new opener to be used by all future calls to 
         :func:`urllib2.urlopen`.
         '''
         if self._http_debug:
-            http = urllib2.HTTPHandler(debuglevel=1)
+            http = _KeepAliveHandler(debuglevel=1)
         else:
-            http = urllib2.HTTPHandler()
+            http = _KeepAliveHandler()
             
         if self._proxy:
             opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(self._cj),
                                           urllib2.ProxyHandler({'http': 
                                                                 self._proxy}), 
                                           urllib2.HTTPBasicAuthHandler(),
-                                          http)
+                                          _RedirectHandler(), http)
         
         else:
             opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(self._cj),
                                           urllib2.HTTPBasicAuthHandler(),
-                                          http)
+                                          _RedirectHandler(), http)
         urllib2.install_opener(opener)
+        #without a proxy set, urllib2 still uses one from the environment
+        global _proxied
+        _proxied = bool(self._proxy or urllib.getproxies().get('http'))
         
 
-    def http_GET(self, url, headers={}, compression=True):
+    def http_GET(self, url, headers={}, compression=True, max_bytes=0,
+                 follow_redirects=True):
         '''
         Perform an HTTP GET request.
         
@@ -169,14 +612,27 @@ class Net:
             headers (dict): A dictionary describing any headers you would like
             to add to the request. (eg. ``{'X-Test': 'testing'}``)
 
-            compression (bool): If ``True`` (default), try to use gzip 
-            compression.
+            compression (bool): If ``True`` (default), try to use gzip or
+            deflate compression.
+            
+            max_bytes (int): If greater than 0, only fetch the first 
+            ``max_bytes`` bytes of the page. A ``Range`` header is sent so
+            servers which support it only send that much, and the read is 
+            capped for servers which ignore it. If the page is compressed 
+            this is the number of compressed bytes transferred.
+            
+            follow_redirects (bool): If ``False``, a redirect response is
+            returned as it is instead of being followed, so where it points
+            can be read from its ``Location`` header (see 
+            :meth:`HttpResponse.get_headers`) without fetching it.
             
         Returns:
             An :class:`HttpResponse` object containing headers and other 
             meta-information about the page and the page content.
         '''
-        return self._fetch(url, headers=headers, compression=compression)
+        return self._fetch(url, headers=headers, compression=compression,
+                           max_bytes=max_bytes, 
+                           follow_redirects=follow_redirects)
         
 
     def http_POST(self, url, form_data, headers={}, compression=True):
@@ -222,32 +678,269 @@ class Net:
         req.add_header('User-Agent', self._user_agent)
         for k, v in headers.items():
             req.add_header(k, v)
-        response = urllib2.urlopen(req)
-        return HttpResponse(response)
+        return self._request(req, HttpResponse, idempotent=True)
 
 
-    def _fetch(self, url, form_data={}, headers={}, compression=True):
+    def http_GET_search(self, url, patterns, headers={}, compression=True,
+                        chunk_size=8192, overlap=4096, max_bytes=0):
         '''
-        Perform an HTTP GET or POST request.
+        Perform an HTTP GET request and search the page for one or more 
+        regular expressions while it is being downloaded.
+        
+        The response is read ``chunk_size`` bytes at a time and each pattern
+        is searched for in the new data plus the last ``overlap`` bytes of the
+        data already seen (so matches spanning two chunks are still found).
+        As soon as every pattern has matched, the connection is closed and the
+        rest of the page is never downloaded.
+        
+        Example::
+        
+            pattern = re.compile('name="hash" value="(.+?)"')
+            r = net.http_GET_search(url, pattern)
+            if r:
+                session_hash = r.group(1)
+        
+        .. note::
+        
+            Patterns are matched against the decompressed but otherwise raw
+            (not decoded to unicode) bytes of the page. A match can be at most 
+            ``overlap`` bytes long and greedy patterns should be anchored on 
+            both sides, as a pattern is considered matched as soon as it
+            matches the data downloaded so far.
+        
+        Args:
+            url (str): The URL to GET.
+            
+            patterns (compiled regex or list of compiled regexes): The patterns
+            to search for.
+            
+        Kwargs:
+            headers (dict): A dictionary describing any headers you would like
+            to add to the request. (eg. ``{'X-Test': 'testing'}``)
+            
+            compression (bool): If ``True`` (default), try to use gzip or
+            deflate compression.
+            
+            chunk_size (int): Number of bytes to read from the connection at a
+            time.
+            
+            overlap (int): Number of bytes from the end of the previous chunk
+            which are searched again along with the next chunk.
+            
+            max_bytes (int): If greater than 0, give up after searching the 
+            first ``max_bytes`` bytes of the page (see :meth:`http_GET`).
+            
+        Returns:
+            If a single pattern was passed, the match object for that pattern
+            or ``None`` if it was not found. If a list of patterns was passed, a
+            list containing a match object (or ``None``) for each pattern in the
+            same order.
+        '''
+        single = hasattr(patterns, 'search')
+        if single:
+            patterns = [patterns]
+        
+        def search(response):
+            matches = [None] * len(patterns)
+            pending = len(patterns)
+            try:
+                tail = ''
+                for chunk in _read_body(response, chunk_size, max_bytes):
+                    window = tail + chunk
+                    for i, pattern in enumerate(patterns):
+                        if matches[i] is None:
+                            r = pattern.search(window)
+                            if r:
+                                matches[i] = r
+                                pending -= 1
+                    if not pending:
+                        break
+                    if overlap:
+                        tail = window[-overlap:]
+            finally:
+                response.close()
+            return matches
+        
+        req = self._build_request(url, headers=headers, 
+                                  compression=compression, max_bytes=max_bytes)
+        matches = self._request(req, search, idempotent=True)
+        if single:
+            return matches[0]
+        return matches
+
+
+    def http_GET_many(self, urls, max_concurrency=8, per_host=4, headers={},
+                      compression=True, ordered=True):
+        '''
+        Perform HTTP GET requests for several URLs in parallel.
+        
+        Each URL is fetched with :meth:`http_GET` from a pool of worker 
+        threads. No more than ``max_concurrency`` requests are in flight at
+        once, and no more than ``per_host`` to any single host.
+        
+        Example::
+        
+            for url, response, error in net.http_GET_many(urls):
+                if error:
+                    print 'failed to fetch %s: %s' % (url, error)
+                else:
+                    print response.content
+        
+        Args:
+            urls (list of str): The URLs to GET.
+            
+        Kwargs:
+            max_concurrency (int): Maximum number of requests in flight.
+            
+            per_host (int): Maximum number of requests in flight to one host.
+            
+            headers (dict): A dictionary describing any headers you would like
+            to add to each request. (eg. ``{'X-Test': 'testing'}``)
+
+            compression (bool): If ``True`` (default), try to use gzip or
+            deflate compression.
+            
+            ordered (bool): If ``True`` (default) wait for all requests to 
+            finish and return the results in the same order as ``urls``. If 
+            ``False`` return an iterator which yields each result as soon as 
+            it is ready.
+            
+        Returns:
+            A list (or iterator) of ``(url, response, error)`` tuples. If the 
+            request succeeded, ``response`` is an :class:`HttpResponse` and 
+            ``error`` is ``None``, otherwise ``response`` is ``None`` and 
+            ``error`` is the exception raised while fetching that URL.
+        '''
+        urls = list(urls)
+        tag = self.get_accounting_tag()
+        in_flight = {}
+        cond = threading.Condition()
+        results = Queue.Queue()
+        
+        pending = []
+        for index, url in enumerate(urls):
+            try:
+                host = urllib2.Request(url).get_host()
+            except ValueError, e:
+                #eg. a relative url, report it without fetching anything
+                results.put((index, url, None, e))
+                continue
+            pending.append((index, url, host))
+        
+        def next_job():
+            cond.acquire()
+            try:
+                while pending:
+                    for i, (index, url, host) in enumerate(pending):
+                        if in_flight.get(host, 0) < per_host:
+                            in_flight[host] = in_flight.get(host, 0) + 1
+                            del pending[i]
+                            return index, url, host
+                    cond.wait()
+                return None
+            finally:
+                cond.release()
+        
+        def worker():
+            _local.tag = tag
+            job = next_job()
+            while job:
+                index, url, host = job
+                response = error = None
+                try:
+                    response = self.http_GET(url, headers=headers, 
+                                             compression=compression)
+                except Exception, e:
+                    error = e
+                cond.acquire()
+                try:
+                    in_flight[host] -= 1
+                    cond.notifyAll()
+                finally:
+                    cond.release()
+                results.put((index, url, response, error))
+                job = next_job()
+                
+        for i in range(min(max_concurrency, len(pending))):
+            t = threading.Thread(target=worker)
+            t.setDaemon(True)
+            t.start()
+        
+        def completed():
+            for i in range(len(urls)):
+                yield results.get()[1:]
+            
+        if not ordered:
+            return completed()
+        
+        ret = [None] * len(urls)
+        for i in range(len(urls)):
+            index, url, response, error = results.get()
+            ret[index] = (url, response, error)
+        return ret
+
+
+    def preconnect(self, urls, max_hosts=4):
+        '''
+        Get ready to make requests to the hosts of some URLs which are likely
+        to be fetched soon (for example the links in a list that has just 
+        been shown to the user).
+        
+        In a background thread, the host names of the URLs are looked up and
+        a keep-alive connection is opened to each distinct host and left in 
+        the connection pool, so the first real request to each host can skip
+        connection setup. Hosts which already have an idle connection are 
+        skipped, as is everything if a proxy is in use.
+        
+        Args:
+            urls (list of str): The URLs likely to be fetched, most likely 
+            first.
+            
+        Kwargs:
+            max_hosts (int): Maximum number of hosts to connect to.
+        '''
+        if self._proxy:
+            return
+        hosts = []
+        for url in urls:
+            if not url.startswith('http://'):
+                continue
+            host = urllib2.Request(url).get_host()
+            if host and host not in hosts:
+                hosts.append(host)
+        hosts = hosts[:max_hosts]
+        if not hosts:
+            return
+        t = threading.Thread(target=_pool.warm, args=(hosts,))
+        t.setDaemon(True)
+        t.start()
+
+
+    def _build_request(self, url, form_data={}, headers={}, compression=True,
+                       max_bytes=0):
+        '''
+        Build a :class:`urllib2.Request` with our user agent and any extra 
+        headers added.
         
         Args:
             url (str): The URL to GET or POST.
             
+        Kwargs:
             form_data (dict): A dictionary of form data to POST. If empty, the 
             request will be a GET, if it contains form data it will be a POST.
-            
-        Kwargs:
+
             headers (dict): A dictionary describing any headers you would like
             to add to the request. (eg. ``{'X-Test': 'testing'}``)
 
-            compression (bool): If ``True`` (default), try to use gzip 
-            compression.
+            compression (bool): If ``True`` (default), try to use gzip or
+            deflate compression.
+            
+            max_bytes (int): If greater than 0, request only the first 
+            ``max_bytes`` bytes of the resource.
 
         Returns:
-            An :class:`HttpResponse` object containing headers and other 
-            meta-information about the page and the page content.
+            A :class:`urllib2.Request` object.
         '''
-        encoding = ''
         req = urllib2.Request(url)
         if form_data:
             form_data = urllib.urlencode(form_data)
@@ -255,60 +948,715 @@ class Net:
         req.add_header('User-Agent', self._user_agent)
         for k, v in headers.items():
             req.add_header(k, v)
+        if max_bytes:
+            req.add_header('Range', 'bytes=0-%d' % (max_bytes - 1))
         if compression:
-            req.add_header('Accept-Encoding', 'gzip')
-        response = urllib2.urlopen(req)
-        return HttpResponse(response)
+            req.add_header('Accept-Encoding', 'gzip, deflate')
+        return req
+        
+
+    def _fetch(self, url, form_data={}, headers={}, compression=True,
+               max_bytes=0, follow_redirects=True):
+        '''
+        Perform an HTTP GET or POST request.
+        
+        Args:
+            url (str): The URL to GET or POST.
+            
+            form_data (dict): A dictionary of form data to POST. If empty, the 
+            request will be a GET, if it contains form data it will be a POST.
+            
+        Kwargs:
+            headers (dict): A dictionary describing any headers you would like
+            to add to the request. (eg. ``{'X-Test': 'testing'}``)
+
+            compression (bool): If ``True`` (default), try to use gzip 
+            compression.
+            
+            max_bytes (int): If greater than 0, only fetch the first 
+            ``max_bytes`` bytes of the page.
+            
+            follow_redirects (bool): If ``False``, return redirect responses
+            instead of following them.
+
+        Returns:
+            An :class:`HttpResponse` object containing headers and other 
+            meta-information about the page and the page content.
+        '''
+        req = self._build_request(url, form_data, headers, compression,
+                                  max_bytes)
+        if not follow_redirects:
+            req.follow_redirects = False
+        return self._request(req, lambda r: HttpResponse(r, max_bytes),
+                             idempotent=not form_data)
+
+
+    def _request(self, req, handler, idempotent=False):
+        '''
+        Send a request and hand the response to ``handler``.
+        
+        This is where every request made by :class:`Net` ends up. The request
+        waits its turn if its host has a limit set with 
+        :meth:`set_host_limit`, and the host's connection slot is held until
+        ``handler`` returns.
+        
+        Args:
+            req (:class:`urllib2.Request`): The request to send.
+            
+            handler (function): Called with the object returned by 
+            :func:`urllib2.urlopen` and should read as much of the response as
+            it needs.
+            
+        Kwargs:
+            idempotent (bool): ``True`` if the request may safely be sent more
+            than once, which allows it to be hedged.
+            
+        Returns:
+            Whatever ``handler`` returns.
+        '''
+        trace = None
+        if _tracing or _trace_hooks:
+            trace = {}
+            start = time.time()
+        _local.trace = trace
+        usage = {'requests': 1}
+        _local.usage = usage
+        limit = _find_host_limit(req.get_host())
+        if limit:
+            wait = limit.acquire()
+            _count('limited_requests')
+            _count('limiter_wait_time', wait)
+            _trace_add('queue', wait)
+        try:
+            archive = _archive
+            if archive and archive.mode == 'replay':
+                response = archive.replay(req)
+            elif archive:
+                response = archive.record(req)
+            elif idempotent and self._hedge_policy:
+                response = self._hedge_policy.open(req)
+            else:
+                response = _urlopen(req)
+            result = handler(response)
+        finally:
+            _local.trace = None
+            _local.usage = None
+            if limit:
+                limit.release()
+            #the origin server, req.get_host() is the proxy if there is one
+            host = urlparse.urlparse(req.get_full_url()).hostname or ''
+            _account(host, self.get_accounting_tag(), usage)
+        if trace is not None:
+            trace['total'] = time.time() - start
+            for hook in list(_trace_hooks):
+                try:
+                    hook(req.get_full_url(), trace)
+                except Exception:
+                    pass
+        return result
 
 
 
-class HttpResponse:
+class HedgePolicy:
     '''
-    This class represents a resoponse from an HTTP request.
+    Hedging policy for idempotent requests (see :meth:`Net.set_hedge_policy`).
     
-    The content is examined and every attempt is made to properly encode it to
-    Unicode.
+    The time taken for each host to send response headers is remembered. If a
+    request has been waiting longer than the ``percentile`` of recent times 
+    for its host, the same request is sent again and the first response to 
+    arrive is used. The other one is closed when it turns up.
     
-    .. seealso::
-        :meth:`Net.http_GET`, :meth:`Net.http_HEAD` and :meth:`Net.http_POST` 
-    '''
+    To stop hedging from adding too much load to a host, no more than 
+    ``max_extra`` duplicate requests are sent for every request to that host,
+    and none are sent while the host is at a limit set with 
+    :meth:`Net.set_host_limit`.
     
-    content = ''
-    '''Unicode encoded string containing the body of the reposne.'''
+    Example::
     
+        from t0mm0.common.net import Net, HedgePolicy
+        net = Net()
+        net.set_hedge_policy(HedgePolicy(percentile=90))
+    '''
     
-    def __init__(self, response):
-        '''
-        Args:
-            response (:class:`mimetools.Message`): The object returned by a call
-            to :func:`urllib2.urlopen`.
+    def __init__(self, percentile=95, max_extra=0.1, min_samples=10,
+                 default_delay=2.0, history=100):
         '''
-        self._response = response
-        html = response.read()
-        try:
-            if response.headers['content-encoding'].lower() == 'gzip':
-                html = gzip.GzipFile(fileobj=StringIO.StringIO(html)).read()
-        except:
-            pass
+        Kwargs:
+            percentile (float): Percentile (0 to 100) of recent response 
+            times for a host after which the request is duplicated.
+            
+            max_extra (float): Maximum number of duplicate requests per 
+            request to a host (eg. ``0.1`` allows one extra request in ten).
+            
+            min_samples (int): Number of response times needed for a host 
+            before the percentile is used.
+            
+            default_delay (float): Seconds to wait before hedging while a host
+            has fewer than ``min_samples`` response times.
+            
+            history (int): Number of recent response times kept for each 
+            host.
+        '''
+        if not 0 <= percentile <= 100:
+            raise ValueError('percentile must be between 0 and 100')
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.history = history
+        self._samples = {}
+        self._requests = {}
+        self._hedges = {}
+        self._lock = threading.Lock()
         
+        
+    def get_delay(self, host):
+        '''Returns the number of seconds to wait before hedging to ``host``.'''
+        self._lock.acquire()
         try:
-            content_type = response.headers['content-type']
-            if 'charset=' in content_type:
-                encoding = content_type.split('charset=')[-1]
-        except:
-            pass
+            samples = sorted(self._samples.get(host, []))
+        finally:
+            self._lock.release()
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, 
+                    int(len(samples) * self.percentile / 100))
+        return samples[index]
+        
+        
+    def record(self, host, latency):
+        '''Remember that ``host`` took ``latency`` seconds to respond.'''
+        self._lock.acquire()
+        try:
+            samples = self._samples.setdefault(host, [])
+            samples.append(latency)
+            if len(samples) > self.history:
+                del samples[0]
+        finally:
+            self._lock.release()
+            
+            
+    def open(self, req):
+        '''
+        Send a request, hedging it if it is slow.
+        
+        Args:
+            req (:class:`urllib2.Request`): The request to send.
+            
+        Returns:
+            The object returned by :func:`urllib2.urlopen` for whichever 
+            attempt responded first.
+        '''
+        host = req.get_host()
+        self._lock.acquire()
+        try:
+            self._requests[host] = self._requests.get(host, 0) + 1
+        finally:
+            self._lock.release()
+        
+        results = Queue.Queue()
+        state = {'done': False}
+        lock = threading.Lock()
+        
+        def attempt(r, hedged, limit=None):
+            start = time.time()
+            try:
+                result = (_urlopen(r), None, hedged)
+                self.record(host, time.time() - start)
+            except Exception, e:
+                result = (None, e, hedged)
+            if limit:
+                limit.release()
+            lock.acquire()
+            try:
+                if state['done']:
+                    if result[0]:
+                        result[0].close()
+                else:
+                    results.put(result)
+            finally:
+                lock.release()
+                
+        def start(r, hedged, limit=None):
+            t = threading.Thread(target=attempt, args=(r, hedged, limit))
+            t.setDaemon(True)
+            t.start()
+            
+        start(req, False)
+        outstanding = 1
+        try:
+            response, error, hedged = results.get(True, self.get_delay(host))
+            outstanding -= 1
+        except Queue.Empty:
+            response = error = None
+            #the original request already has its turn with the host's limit
+            #(see Net._request), a duplicate needs one of its own. it isn't 
+            #worth waiting for, so only hedge if one is free right now
+            limit = _find_host_limit(host)
+            if (self._allow_hedge(host) and 
+                (not limit or limit.try_acquire())):
+                _count('hedged_requests')
+                start(_copy_request(req), True, limit)
+                outstanding += 1
+        
+        while response is None and outstanding:
+            response, err, hedged = results.get()
+            outstanding -= 1
+            error = error or err
+            
+        lock.acquire()
+        try:
+            state['done'] = True
+            while True:
+                try:
+                    extra = results.get_nowait()[0]
+                except Queue.Empty:
+                    break
+                if extra:
+                    extra.close()
+        finally:
+            lock.release()
+            
+        if response is None:
+            raise error
+        if hedged:
+            _count('hedge_wins')
+        return response
+    
+    
+    def _allow_hedge(self, host):
+        '''Returns ``True`` if another duplicate request to ``host`` is OK.'''
+        self._lock.acquire()
+        try:
+            hedges = self._hedges.get(host, 0)
+            if hedges + 1 > self.max_extra * self._requests.get(host, 0):
+                return False
+            self._hedges[host] = hedges + 1
+            return True
+        finally:
+            self._lock.release()
 
-        r = re.search('<meta\s+http-equiv="Content-Type"\s+content="(?:.+?);' +
-                      '\s+charset=(.+?)"', html, re.IGNORECASE)
-        if r:
-            encoding = r.group(1) 
-                   
+
+
+class DNSCache:
+    '''
+    A small in-process cache of host name lookups, used when :class:`Net` 
+    opens a new connection.
+    
+    Successful lookups are kept for ``ttl`` seconds and failed ones for 
+    ``negative_ttl`` seconds, so a host is looked up at most once per TTL 
+    however many requests are made to it.
+    
+    The function used to do the real lookups can be replaced, for example 
+    with a stub for testing::
+    
+        def resolver(host, port, family=0, socktype=0):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', 
+                     ('127.0.0.1', port))]
+        net.set_dns_cache(DNSCache(resolver=resolver))
+    '''
+    
+    def __init__(self, ttl=300, negative_ttl=30, resolver=None):
+        '''
+        Kwargs:
+            ttl (int): Seconds to remember successful lookups for.
+            
+            negative_ttl (int): Seconds to remember failed lookups for.
+            
+            resolver (function): Function with the same signature and return 
+            value as :func:`socket.getaddrinfo` used to look up host names 
+            which are not in the cache. Defaults to :func:`socket.getaddrinfo`.
+        '''
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.resolver = resolver or socket.getaddrinfo
+        self._cache = {}
+        self._lock = threading.Lock()
+        
+        
+    def resolve(self, host, port):
+        '''
+        Look up a host name.
+        
+        Args:
+            host (str): The host name to look up.
+            
+            port (int): The port which will be connected to.
+            
+        Returns:
+            A list of address tuples as returned by :func:`socket.getaddrinfo`.
+            
+        Raises:
+            :exc:`socket.gaierror` if the host name can't be resolved.
+        '''
+        key = (host, port)
+        self._lock.acquire()
         try:
-            html = unicode(html, encoding)
-        except:
-            pass
+            entry = self._cache.get(key)
+        finally:
+            self._lock.release()
+        if entry and entry[0] > time.time():
+            _count('dns_cache_hits')
+            _usage_add('cache_hits', 1)
+            addresses, error = entry[1:]
+            if error:
+                raise error
+            return addresses
+        
+        _count('dns_lookups')
+        try:
+            addresses = self.resolver(host, port, 0, socket.SOCK_STREAM)
+            entry = (time.time() + self.ttl, addresses, None)
+        except socket.gaierror, e:
+            entry = (time.time() + self.negative_ttl, None, e)
+        self._lock.acquire()
+        try:
+            self._cache[key] = entry
+        finally:
+            self._lock.release()
+        if entry[2]:
+            raise entry[2]
+        return addresses
+    
+    
+    def forget(self, host, port):
+        '''Remove a host from the cache so it is looked up again next time.'''
+        self._lock.acquire()
+        try:
+            self._cache.pop((host, port), None)
+        finally:
+            self._lock.release()
+            
             
-        self.content = html
+    def clear(self):
+        '''Remove everything from the cache.'''
+        self._lock.acquire()
+        try:
+            self._cache = {}
+        finally:
+            self._lock.release()
+
+
+
+class HttpArchive:
+    '''
+    A collection of recorded HTTP exchanges (see :meth:`Net.set_archive`).
+    
+    In ``'record'`` mode every request is sent as normal and the request 
+    method, URL, form data and headers are stored along with the response 
+    status, headers, final URL (after redirects) and body. In ``'replay'`` 
+    mode requests never touch the network, instead they are answered with the
+    recorded response which has the same method, URL and form data. If the 
+    same request was recorded more than once the responses are replayed in 
+    the order they were recorded (the last one is repeated after that). If
+    there is no recording, :exc:`urllib2.URLError` is raised.
+    
+    To capture a whole session, set one archive and save it at the end::
+    
+        archive = HttpArchive()
+        net.set_archive(archive)
+        ...
+        archive.save('/path/to/session.archive')
+        
+    To capture a single resolve, set a new archive just for that call::
+    
+        net.set_archive(HttpArchive())
+        media_url = urlresolver.resolve(web_url)
+        net.get_archive().save('/path/to/resolve.archive')
+        net.set_archive(None)
+    
+    Then to replay it::
+        
+        net.set_archive(HttpArchive('/path/to/resolve.archive', 'replay'))
+        media_url = urlresolver.resolve(web_url)
+        
+    Archives are meant to be passed around, so they are saved as (compressed)
+    JSON rather than anything which could run code when it is loaded, and 
+    unless ``keep_secrets`` is set the ``Cookie`` and ``Authorization`` 
+    request headers and any form fields which look like passwords are masked
+    before they are stored. Masked form fields still match when replaying.
+    '''
+    
+    secret_headers = ('Cookie', 'Authorization', 'Proxy-authorization')
+    '''Request headers which are masked when recording.'''
+    
+    secret_fields = re.compile('pass|pwd|secret', re.IGNORECASE)
+    '''Matches the names of form fields which are masked when recording.'''
+    
+    mask = '********'
+    '''What masked values are replaced with.'''
+    
+    def __init__(self, path='', mode='record', keep_secrets=False):
+        '''
+        Kwargs:
+            path (str): Full path to an archive file created by :meth:`save` 
+            to load exchanges from.
+            
+            mode (str): ``'record'`` or ``'replay'``.
+            
+            keep_secrets (bool): If ``True``, store cookies, authorization 
+            headers and passwords as they were sent instead of masking them.
+            Only use this for archives which won't be shared.
+        '''
+        self.mode = mode
+        self.keep_secrets = keep_secrets
+        self.exchanges = []
+        self._replayed = {}
+        self._lock = threading.Lock()
+        if path:
+            self.load(path)
+            
+            
+    def load(self, path):
+        '''
+        Adds the exchanges saved in an archive file.
+        
+        Args:
+            path (str): Full path to the archive file.
+        '''
+        f = open(path, 'rb')
+        try:
+            saved = json.loads(zlib.decompress(f.read()), encoding='latin-1')
+        finally:
+            f.close()
+        #json gives back unicode, requests and responses are byte strings
+        exchanges = []
+        for e in saved:
+            exchange = dict((str(k), _latin1(v)) for k, v in e.items())
+            exchange['request_headers'] = dict(
+                                (_latin1(k), _latin1(v)) 
+                                for k, v in e['request_headers'].items())
+            exchange['headers'] = [_latin1(h) for h in e['headers']]
+            exchange['body'] = base64.b64decode(e['body'])
+            exchanges.append(exchange)
+        self._lock.acquire()
+        try:
+            self.exchanges.extend(exchanges)
+        finally:
+            self._lock.release()
+            
+            
+    def save(self, path):
+        '''
+        Saves all exchanges to a compressed archive file.
+        
+        Args:
+            path (str): Full path to the archive file.
+        '''
+        self._lock.acquire()
+        try:
+            exchanges = [dict(e, body=base64.b64encode(e['body'])) 
+                         for e in self.exchanges]
+        finally:
+            self._lock.release()
+        data = zlib.compress(json.dumps(exchanges, encoding='latin-1'))
+        f = open(path, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+            
+            
+    def record(self, req):
+        '''
+        Send a request and store the exchange.
+        
+        Args:
+            req (:class:`urllib2.Request`): The request to send.
+            
+        Returns:
+            An object like the one returned by :func:`urllib2.urlopen` which 
+            reads the recorded response.
+        '''
+        try:
+            response = _urlopen(req)
+        except urllib2.HTTPError, e:
+            response = e
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        data = req.get_data() or ''
+        headers = dict(req.header_items())
+        if not self.keep_secrets:
+            data = self._mask_data(data)
+            for name in self.secret_headers:
+                if name in headers:
+                    headers[name] = self.mask
+        exchange = {'method': req.get_method(), 
+                    'url': req.get_full_url(),
+                    'data': data,
+                    'request_headers': headers,
+                    'status': response.code, 
+                    'reason': response.msg,
+                    'headers': response.info().headers,
+                    'final_url': response.geturl(),
+                    'body': body}
+        self._lock.acquire()
+        try:
+            self.exchanges.append(exchange)
+        finally:
+            self._lock.release()
+        return self._response(exchange)
+    
+    
+    def replay(self, req):
+        '''
+        Find the recorded response to a request.
+        
+        Args:
+            req (:class:`urllib2.Request`): The request to answer.
+            
+        Returns:
+            An object like the one returned by :func:`urllib2.urlopen` which 
+            reads the recorded response.
+        '''
+        key = self._key(req.get_method(), req.get_full_url(), req.get_data())
+        self._lock.acquire()
+        try:
+            matches = [e for e in self.exchanges 
+                       if self._key(e['method'], e['url'], e['data']) == key]
+            if matches:
+                index = self._replayed.get(key, 0)
+                self._replayed[key] = index + 1
+                exchange = matches[min(index, len(matches) - 1)]
+        finally:
+            self._lock.release()
+        if not matches:
+            _count('replay_misses')
+            raise urllib2.URLError('no recorded response for %s %s' % key[:2])
+        _count('replayed')
+        return self._response(exchange)
+    
+    
+    def _key(self, method, url, data):
+        '''
+        Returns what exchanges are matched on, ignoring form data order and
+        the values of masked form fields.
+        '''
+        data = self._mask_data(data or '')
+        return (method, url, tuple(sorted(cgi.parse_qsl(data, True))))
+        
+        
+    def _mask_data(self, data):
+        '''Returns form data with the values of password fields masked.'''
+        fields = cgi.parse_qsl(data, True)
+        if not [k for k, v in fields if self.secret_fields.search(k)]:
+            return data
+        return urllib.urlencode([(k, self.secret_fields.search(k) and 
+                                     self.mask or v) for k, v in fields])
+            
+            
+    def _response(self, exchange):
+        '''
+        Returns a :func:`urllib2.urlopen` style response for an exchange, 
+        raising :exc:`urllib2.HTTPError` for error statuses.
+        '''
+        headers = httplib.HTTPMessage(
+                            StringIO.StringIO(''.join(exchange['headers'])))
+        fp = StringIO.StringIO(exchange['body'])
+        if exchange['status'] >= 400:
+            raise urllib2.HTTPError(exchange['final_url'], exchange['status'],
+                                    exchange['reason'], headers, fp)
+        response = urllib.addinfourl(fp, headers, exchange['final_url'])
+        response.code = exchange['status']
+        response.msg = exchange['reason']
+        return response
+
+
+
+def _latin1(value):
+    '''Turns strings loaded from JSON back into byte strings.'''
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    return value
+
+
+class HttpResponse(object):
+    '''
+    This class represents a resoponse from an HTTP request.
+    
+    The body of the response is available as a byte string in :attr:`body`. 
+    This is all most regular expressions need, and is the quickest way to get
+    at the page. 
+    
+    :attr:`content` contains the body converted to Unicode. The conversion is 
+    only done the first time :attr:`content` is accessed and every attempt is
+    made to use the correct character encoding.
+    
+    .. seealso::
+        :meth:`Net.http_GET`, :meth:`Net.http_HEAD` and :meth:`Net.http_POST` 
+    '''
+    
+    body = ''
+    '''String containing the (decompressed) body of the response as bytes.'''
+    
+    timings = None
+    '''
+    Dictionary of the time spent in each phase of the request, or ``None`` if 
+    tracing is off (see :meth:`Net.set_tracing`).
+    '''
+    
+    
+    def __init__(self, response, max_bytes=0):
+        '''
+        Args:
+            response (:class:`mimetools.Message`): The object returned by a call
+            to :func:`urllib2.urlopen`.
+            
+        Kwargs:
+            max_bytes (int): If greater than 0, read at most ``max_bytes`` 
+            bytes of the body and close the connection.
+        '''
+        self._response = response
+        self._content = None
+        self.timings = getattr(_local, 'trace', None)
+        try:
+            self.body = ''.join(_read_body(response, max_bytes=max_bytes))
+        finally:
+            if max_bytes:
+                response.close()
+    
+    
+    @property
+    def content(self):
+        '''
+        Unicode encoded string containing the body of the reposne. If the 
+        character encoding can't be worked out (or is wrong) this is the same
+        as :attr:`body`.
+        '''
+        if self._content is None:
+            if self.timings is not None:
+                start = time.time()
+            content = self.body
+            encoding = self.get_encoding()
+            if encoding:
+                try:
+                    content = unicode(content, encoding)
+                except (LookupError, UnicodeError):
+                    pass
+            self._content = content
+            if self.timings is not None:
+                self.timings['decode'] = time.time() - start
+        return self._content
+        
+        
+    def get_encoding(self):
+        '''
+        Returns the character encoding of the body, or ``''`` if it is not
+        known. 
+        
+        A ``<meta http-equiv="Content-Type">`` tag in the first KB of the body
+        takes precedence over the ``Content-Type`` header.
+        '''
+        encoding = ''
+        content_type = self._response.info().getheader('content-type') or ''
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[-1]
+        r = _meta_charset_re.search(self.body, 0, 1024)
+        if r:
+            encoding = r.group(1)
+        return encoding.strip()
     
     
     def get_headers(self):
@@ -322,3 +1670,607 @@ class HttpResponse:
         a redirect was followed.
         '''
         return self._response.geturl()
+
+
+
+class _Decompressor:
+    '''
+    Incrementally decompresses a gzip or deflate encoded response body.
+    
+    If the body turns out not to be compressed at all (some servers send a 
+    ``Content-Encoding`` header for plain content) it is passed through 
+    unchanged. Any failure is counted in the ``decompress_errors`` stat.
+    '''
+    
+    def __init__(self, encoding):
+        '''
+        Args:
+            encoding (str): The ``Content-Encoding`` of the body, either 
+            ``'gzip'`` or ``'deflate'``.
+        '''
+        self._encoding = encoding
+        if encoding == 'gzip':
+            self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._d = zlib.decompressobj(zlib.MAX_WBITS)
+        self._started = False
+        self._passthrough = False
+        self.failed = False
+        
+        
+    def decompress(self, data):
+        '''Returns the decompressed data available after adding ``data``.'''
+        if self._passthrough:
+            return data
+        if self.failed:
+            return ''
+        try:
+            out = self._d.decompress(data)
+        except zlib.error:
+            if not self._started and self._encoding == 'deflate':
+                #some servers send raw deflate data without the zlib header
+                self._d = zlib.decompressobj(-zlib.MAX_WBITS)
+                try:
+                    out = self._d.decompress(data)
+                except zlib.error:
+                    return self._fail(data)
+            else:
+                return self._fail(data)
+        self._started = True
+        return out
+        
+        
+    def flush(self):
+        '''Returns any remaining decompressed data.'''
+        if self._passthrough or self.failed:
+            return ''
+        try:
+            return self._d.flush()
+        except zlib.error:
+            return self._fail('')
+    
+    
+    def _fail(self, data):
+        '''
+        Records a decompression failure. If nothing has been decompressed yet 
+        the body is assumed not to be compressed at all and passed through.
+        '''
+        _count('decompress_errors')
+        if not self._started:
+            self._passthrough = True
+            return data
+        self.failed = True
+        return ''
+
+
+def _read_body(response, chunk_size=65536, max_bytes=0):
+    '''
+    Generator which reads the body of a response a chunk at a time, 
+    decompressing it on the fly if required.
+    
+    Args:
+        response (:class:`mimetools.Message`): The object returned by a call
+        to :func:`urllib2.urlopen`.
+        
+    Kwargs:
+        chunk_size (int): Number of bytes to read from the connection at a 
+        time.
+        
+        max_bytes (int): If greater than 0, stop after reading ``max_bytes`` 
+        bytes from the connection.
+        
+    Yields:
+        Non-empty strings of (decompressed) body data.
+    '''
+    encoding = (response.info().getheader('content-encoding') or '').lower()
+    decompressor = None
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        decompressor = _Decompressor(encoding.replace('x-', ''))
+    trace = getattr(_local, 'trace', None)
+    remaining = max_bytes
+    while True:
+        if trace is not None:
+            start = time.time()
+        if max_bytes:
+            if remaining <= 0:
+                break
+            chunk = response.read(min(chunk_size, remaining))
+            remaining -= len(chunk)
+        else:
+            chunk = response.read(chunk_size)
+        if trace is not None:
+            trace['read'] = trace.get('read', 0) + time.time() - start
+        if not chunk:
+            break
+        if decompressor:
+            _usage_add('compressed_bytes', len(chunk))
+            if trace is not None:
+                start = time.time()
+            chunk = decompressor.decompress(chunk)
+            if trace is not None:
+                trace['decompress'] = (trace.get('decompress', 0) + 
+                                       time.time() - start)
+            _usage_add('decompressed_bytes', len(chunk))
+        if chunk:
+            yield chunk
+    if decompressor:
+        chunk = decompressor.flush()
+        _usage_add('decompressed_bytes', len(chunk))
+        if chunk:
+            yield chunk
+
+
+
+class _HostLimit:
+    '''
+    A token bucket rate limit plus a cap on concurrent requests for one host
+    (see :meth:`Net.set_host_limit`). Waiting requests are let through in 
+    first come, first served order.
+    '''
+    
+    def __init__(self, rate, burst, max_connections):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.max_connections = max_connections
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._active = 0
+        self._waiting = []
+        self._cond = threading.Condition()
+        
+        
+    def acquire(self):
+        '''
+        Wait until it is this request's turn.
+        
+        Returns:
+            The number of seconds spent waiting.
+        '''
+        start = time.time()
+        ticket = object()
+        self._cond.acquire()
+        try:
+            self._waiting.append(ticket)
+            while True:
+                wait = None
+                if self._waiting[0] is ticket:
+                    wait = self._wait_time()
+                    if wait == 0:
+                        break
+                self._cond.wait(wait)
+            self._waiting.pop(0)
+            if self.rate:
+                self._tokens -= 1
+            self._active += 1
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+        return time.time() - start
+        
+        
+    def try_acquire(self):
+        '''
+        Like :meth:`acquire` but doesn't wait.
+        
+        Returns:
+            ``True`` if the request may start now (call :meth:`release` when
+            it finishes), ``False`` if it would have had to wait.
+        '''
+        self._cond.acquire()
+        try:
+            if self._waiting or self._wait_time() != 0:
+                return False
+            if self.rate:
+                self._tokens -= 1
+            self._active += 1
+            return True
+        finally:
+            self._cond.release()
+        
+        
+    def release(self):
+        '''Finish a request started after :meth:`acquire`.'''
+        self._cond.acquire()
+        try:
+            self._active -= 1
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+            
+            
+    def _wait_time(self):
+        '''
+        Returns ``0`` if a request may start now, the number of seconds until
+        the next token is available, or ``None`` to wait for a request to 
+        finish.
+        '''
+        if self.max_connections and self._active >= self.max_connections:
+            return None
+        if self.rate:
+            now = time.time()
+            self._tokens = min(self.burst, 
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+        return 0
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+def _find_host_limit(host):
+    '''
+    Returns the :class:`_HostLimit` which applies to ``host`` (which may 
+    include a port) or ``None``.
+    '''
+    if not _host_limits:
+        return None
+    labels = host.split(':')[0].lower().split('.')
+    _host_limits_lock.acquire()
+    try:
+        for i in range(len(labels)):
+            limit = _host_limits.get('.'.join(labels[i:]))
+            if limit:
+                return limit
+    finally:
+        _host_limits_lock.release()
+    return None
+
+
+def _copy_request(req):
+    '''
+    Returns a copy of a :class:`urllib2.Request` which can be sent separately,
+    keeping any per-request attributes such as ``timeout`` and 
+    ``follow_redirects``.
+    '''
+    new = copy.copy(req)
+    new.headers = dict(req.headers)
+    new.unredirected_hdrs = dict(req.unredirected_hdrs)
+    return new
+
+
+class _ConnectionPool:
+    '''
+    Keeps idle keep-alive :class:`httplib.HTTPConnection` objects by host so 
+    they can be reused by later requests. Shared by all :class:`Net` 
+    instances.
+    '''
+    
+    max_idle = 4
+    '''Maximum number of idle connections kept for each host.'''
+    
+    max_idle_time = 30
+    '''Seconds after which an idle connection is thrown away.'''
+    
+    
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+        
+        
+    def get(self, host):
+        '''
+        Returns an idle connection to ``host`` or ``None`` if there aren't 
+        any.
+        '''
+        now = time.time()
+        self._lock.acquire()
+        try:
+            conns = self._idle.get(host, [])
+            while conns:
+                conn, released = conns.pop()
+                if now - released < self.max_idle_time:
+                    return conn
+                conn.close()
+        finally:
+            self._lock.release()
+        return None
+        
+        
+    def put(self, host, conn):
+        '''Returns a connection which has finished a request to the pool.'''
+        self._lock.acquire()
+        try:
+            conns = self._idle.setdefault(host, [])
+            if len(conns) < self.max_idle:
+                conns.append((conn, time.time()))
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+        
+        
+    def warm(self, hosts, timeout=10):
+        '''
+        Opens a connection to each host which doesn't already have an idle 
+        one and adds it to the pool. Errors are ignored. ``timeout`` is only
+        used for connecting, requests sent on the connection later use their
+        own.
+        '''
+        for host in hosts:
+            self._lock.acquire()
+            try:
+                idle = self._idle.get(host)
+            finally:
+                self._lock.release()
+            if idle:
+                continue
+            conn = _HTTPConnection(host, timeout=timeout)
+            try:
+                conn.connect()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                continue
+            _count('preconnects')
+            self.put(host, conn)
+            
+            
+    def clear(self):
+        '''Closes all idle connections.'''
+        self._lock.acquire()
+        try:
+            for conns in self._idle.values():
+                for conn, released in conns:
+                    conn.close()
+            self._idle = {}
+        finally:
+            self._lock.release()
+
+_pool = _ConnectionPool()
+_dns_cache = DNSCache()
+
+
+class _HTTPConnection(httplib.HTTPConnection):
+    '''
+    An :class:`httplib.HTTPConnection` which looks up host names in the shared
+    :class:`DNSCache`.
+    '''
+    
+    def connect(self):
+        cache = _dns_cache
+        if cache is None:
+            return httplib.HTTPConnection.connect(self)
+        
+        start = time.time()
+        addresses = cache.resolve(self.host, self.port)
+        _trace_add('dns', time.time() - start)
+        
+        error = socket.error('getaddrinfo returns an empty list')
+        start = time.time()
+        for family, socktype, proto, name, address in addresses:
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(self.timeout)
+                sock.connect(address)
+                self.sock = sock
+                _trace_add('connect', time.time() - start)
+                return
+            except socket.error, e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        #the cached addresses may be out of date
+        cache.forget(self.host, self.port)
+        raise error
+
+
+class _PooledResponse:
+    '''
+    File-like wrapper around a :class:`httplib.HTTPResponse` which hands the 
+    connection back to the pool once the whole response has been read.
+    '''
+    
+    def __init__(self, host, conn, response):
+        self._host = host
+        self._conn = conn
+        self._response = response
+        
+        
+    def read(self, amt=None):
+        if self._response is None:
+            return ''
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        _usage_add('bytes_received', len(data))
+        if self._response.isclosed():
+            self._release()
+        return data
+        
+        
+    def readline(self, limit=-1):
+        line = []
+        while limit < 0 or len(line) < limit:
+            c = self.read(1)
+            if not c:
+                break
+            line.append(c)
+            if c == '\n':
+                break
+        return ''.join(line)
+        
+        
+    def close(self):
+        if self._response is not None:
+            #the rest of the response is still waiting on the socket
+            self._response.close()
+            self._conn.close()
+            self._response = None
+            
+            
+    def _release(self):
+        if self._response.will_close:
+            self._conn.close()
+        else:
+            _pool.put(self._host, self._conn)
+        self._response = None
+
+
+def _pooled_open(req, debuglevel=0):
+    '''
+    Send a request over a connection from the shared pool, opening a new one
+    if there isn't an idle one or the idle one has been closed by the server.
+    Requests other than GET and HEAD always get a new connection (which goes
+    back to the pool afterwards) so they are never sent twice.
+    
+    Returns:
+        A :func:`urllib2.urlopen` style response which hands the connection 
+        back to the pool once it has been read.
+    '''
+    host = req.get_host()
+    if not host:
+        raise urllib2.URLError('no host given')
+
+    headers = dict(req.unredirected_hdrs)
+    headers.update(dict((k, v) for k, v in req.headers.items()
+                        if k not in headers))
+    headers['Connection'] = 'keep-alive'
+    headers = dict((name.title(), val) for name, val in headers.items())
+    
+    #the server may close an idle connection at any time. if that happens
+    #part way through a request we can't tell whether it was processed, so
+    #only requests which are safe to send twice go on an idle connection
+    conn = None
+    if req.get_method() in ('GET', 'HEAD'):
+        conn = _pool.get(host)
+    timeout = getattr(req, 'timeout', socket._GLOBAL_DEFAULT_TIMEOUT)
+    response = None
+    if conn:
+        #the connection may have been opened with another timeout (eg. by 
+        #_ConnectionPool.warm()), use this request's one
+        conn.timeout = timeout
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            conn.sock.settimeout(socket.getdefaulttimeout())
+        else:
+            conn.sock.settimeout(timeout)
+        try:
+            response = _send(conn, req, headers, debuglevel)
+            _usage_add('cache_hits', 1)
+        except (socket.error, httplib.HTTPException):
+            #server closed the idle connection, try again on a new one
+            conn.close()
+    if response is None:
+        conn = _HTTPConnection(host, timeout=timeout)
+        try:
+            response = _send(conn, req, headers, debuglevel)
+        except socket.error, e:
+            conn.close()
+            raise urllib2.URLError(e)
+        
+    fp = _PooledResponse(host, conn, response)
+    resp = urllib.addinfourl(fp, response.msg, req.get_full_url())
+    resp.code = response.status
+    resp.msg = response.reason
+    return resp
+    
+    
+def _send(conn, req, headers, debuglevel=0):
+    '''Send a request on ``conn`` and return its response.'''
+    conn.set_debuglevel(debuglevel)
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        setup = trace.get('dns', 0) + trace.get('connect', 0)
+        start = time.time()
+    conn.request(req.get_method(), req.get_selector(), req.data, headers)
+    _usage_add('bytes_sent', 
+               len(req.get_method()) + len(req.get_selector()) + 12 +
+               sum([len(k) + len(v) + 4 for k, v in headers.items()]) + 2 +
+               len(req.data or ''))
+    response = conn.getresponse()
+    headers_size = len(''.join(response.msg.headers))
+    _usage_add('bytes_received', len(response.reason) + headers_size + 17)
+    if trace is not None:
+        #connection setup happens inside request() for new connections
+        setup = trace.get('dns', 0) + trace.get('connect', 0) - setup
+        trace['ttfb'] = (trace.get('ttfb', 0) + 
+                         time.time() - start - setup)
+    return response
+
+
+class _KeepAliveHandler(urllib2.HTTPHandler):
+    '''
+    A :class:`urllib2.HTTPHandler` which uses persistent connections from the
+    shared connection pool instead of opening and closing a connection for 
+    every request.
+    '''
+    
+    def http_open(self, req):
+        return _pooled_open(req, self._debuglevel)
+
+
+class _UrllibTransport:
+    '''Sends requests through the installed :mod:`urllib2` opener.'''
+    
+    name = 'urllib2'
+    
+    def open(self, req):
+        return urllib2.urlopen(req)
+
+
+class _HttplibTransport:
+    '''
+    Sends plain HTTP requests straight to the shared connection pool, adding 
+    and storing cookies with the :class:`Net` cookie jar and following 
+    redirects the same way :mod:`urllib2` does. Requests which need a proxy 
+    or aren't plain HTTP are handed to :mod:`urllib2`.
+    '''
+    
+    name = 'httplib'
+    
+    max_redirects = 10
+    '''Maximum number of redirects followed for a single request.'''
+    
+    
+    def __init__(self, debuglevel=0):
+        self._debuglevel = debuglevel
+        
+        
+    def open(self, req):
+        redirects = 0
+        while True:
+            if req.get_type() != 'http' or _proxied:
+                #never send around a proxy
+                return urllib2.urlopen(req)
+            if req.has_data() and not req.has_header('Content-type'):
+                req.add_unredirected_header('Content-type', 
+                                    'application/x-www-form-urlencoded')
+            Net._cj.add_cookie_header(req)
+            response = _pooled_open(req, self._debuglevel)
+            Net._cj.extract_cookies(response, req)
+            
+            code = response.code
+            location = (response.info().getheader('location') or 
+                        response.info().getheader('uri'))
+            if (code in (301, 302, 303, 307) and location and 
+                redirects < self.max_redirects and 
+                getattr(req, 'follow_redirects', True)):
+                #read the rest so the connection goes back to the pool
+                response.read()
+                response.close()
+                req = self._redirect(req, code, location)
+                redirects += 1
+                continue
+            if code >= 400:
+                raise urllib2.HTTPError(req.get_full_url(), code, response.msg,
+                                        response.info(), response)
+            return response
+            
+            
+    def _redirect(self, req, code, location):
+        '''Returns the request to send next for a redirect response.'''
+        url = urlparse.urljoin(req.get_full_url(), location)
+        method = req.get_method()
+        if code == 307 or method == 'HEAD':
+            return req.__class__(url, req.get_data(), dict(req.headers),
+                                 req.get_origin_req_host(), True)
+        #like urllib2, POSTs become GETs without the form data
+        headers = dict((k, v) for k, v in req.headers.items()
+                       if k.lower() not in ('content-length', 'content-type'))
+        return urllib2.Request(url, headers=headers, 
+                               origin_req_host=req.get_origin_req_host(),
+                               unverifiable=True)
+
+_transport = _UrllibTransport()
@@ -22,17 +22,25 @@ For most cases you probably want to use :func:`urlresolver.resolve` or
 '''
 
 import os
+import threading
+import time
 import common
 import plugnplay
+import quota
 from plugnplay.interfaces import UrlResolver
 from plugnplay.interfaces import PluginSettings
 from plugnplay.interfaces import SiteAuth
+from t0mm0.common.net import Net
 import xbmcgui
 
 #load all available plugins
 plugnplay.set_plugin_dirs(common.plugins_path)
 plugnplay.load_plugins()
 
+#one lock and login count for each SiteAuth plugin, see _login()
+_login_lock = threading.Lock()
+_login_state = {}
+
 def resolve(web_url):
     """
     Resolve a web page to a media stream.
@@ -62,12 +70,84 @@ def resolve(web_url):
     imp = find_resolver(web_url)
     if imp:
         common.addon.log_notice('resolving using %s plugin' % imp.name)
-        if SiteAuth in imp.implements:
-            common.addon.log_debug('logging in')
-            imp.login()
-        return imp.get_media_url(web_url)
+        #count all http traffic made while resolving against this plugin
+        net = Net()
+        tag = net.get_accounting_tag()
+        net.set_accounting_tag(imp.name)
+        try:
+            if SiteAuth in imp.implements:
+                _login(imp)
+            return imp.get_media_url(web_url)
+        finally:
+            net.set_accounting_tag(tag)
+            _save_accounting(net)
     return False
     
+def _has_credentials(imp):
+    #whether a SiteAuth plugin has anything to log in with
+    if PluginSettings not in imp.implements:
+        return False
+    login = imp.get_setting('login')
+    if login:
+        return login == 'true'
+    return bool(imp.get_setting('username') and imp.get_setting('password'))
+
+def warm_up(timeout=10):
+    '''
+    Log in to the file hosters of all :class:`SiteAuth` plugins in the 
+    background, so the first :func:`resolve` doesn't have to wait for a 
+    login.
+    
+    Call this straight after importing :mod:`urlresolver` if you want it::
+    
+        import urlresolver
+        urlresolver.warm_up()
+        
+    Plugins without credentials in their settings (their ``login`` setting is
+    off, or they have no ``username`` and ``password``) are skipped, as are
+    plugins whose :meth:`SiteAuth.is_logged_in` returns ``True`` because they
+    still have a valid session.
+    The logins run in parallel in daemon threads, and a :func:`resolve` which
+    needs a login that is still in progress waits for it rather than starting
+    another one.
+    
+    Kwargs:
+        timeout (float): Number of seconds to wait for the logins. Any still 
+        running after this are left to finish on their own.
+        
+    Returns:
+        The daemon :class:`threading.Thread` running the warm up.
+    '''
+    def login(imp):
+        net = Net()
+        net.set_accounting_tag(imp.name)
+        try:
+            _login(imp)
+        except Exception, e:
+            common.addon.log_error('warm up login to %s failed: %s' % 
+                                   (imp.name, e))
+            
+    def run():
+        threads = []
+        for imp in SiteAuth.implementors():
+            if not _has_credentials(imp) or imp.is_logged_in():
+                continue
+            t = threading.Thread(target=login, args=(imp,))
+            t.setDaemon(True)
+            t.start()
+            threads.append((imp, t))
+        deadline = time.time() + timeout
+        for imp, t in threads:
+            t.join(max(0, deadline - time.time()))
+            if t.isAlive():
+                common.addon.log_notice('warm up login to %s is taking '
+                                        'longer than %ss' % (imp.name, timeout))
+            
+    t = threading.Thread(target=run)
+    t.setDaemon(True)
+    t.start()
+    return t
+
 def filter_urls(urls):
     '''
     Takes a list of URLs to web pages that are thought to be associated with 
@@ -112,7 +192,8 @@ def find_resolver(web_url):
     '''
     Finds the first resolver that says it can resolve the given URL to a media 
     file. Note that it might not actually be able to, but it advertises the
-    fact that it can.
+    fact that it can. Resolvers whose download limit has been reached (see
+    :mod:`urlresolver.quota`) are only used if no other resolver can do it.
     
     .. note::
     
@@ -128,17 +209,21 @@ def find_resolver(web_url):
         :class:`urlresolver.plugnplay.interfaces.UrlResolver` and advertises
         that it can resolve the given ``web_url``.
     '''
+    limited = False
     for imp in UrlResolver.implementors():
         if imp.valid_url(web_url):
-            return imp
-    return False
+            if not quota.is_limited(imp.name):
+                return imp
+            limited = limited or imp
+    return limited
 
 def choose_source(sources):
     '''
     Given a dictionary of sources where the keys are web URLs to be resolved and
     the values are a title to display this function checks which are playable
     and if there are more than one it pops up a dialog box displaying the 
-    choices.
+    choices. Sources from file hosters whose download limit has been reached
+    are listed last.
     
     Example::
     
@@ -160,9 +245,26 @@ def choose_source(sources):
     
     #show dialog to choose source
     if len(sources) > 1:
+        urls = sources.keys()
+        titles = []
+        limited = []
+        for url in urls:
+            title = sources[url]
+            is_limited = quota.is_limited(find_resolver(url).name)
+            if is_limited:
+                title += ' (download limit reached)'
+            titles.append(title)
+            limited.append(is_limited)
+        order = sorted(range(len(urls)), key=lambda i: limited[i])
+        urls = [urls[i] for i in order]
+        titles = [titles[i] for i in order]
+        #get connections to the hosters ready while the user decides
+        Net().preconnect(urls)
         dialog = xbmcgui.Dialog()
-        index = dialog.select('Choose your stream', sources.values())
-        return resolve(sources.keys()[index])
+        index = dialog.select('Choose your stream', titles)
+        if index < 0:
+            return False
+        return resolve(urls[index])
     
     #only one playable source so just play it
     elif len(sources) == 1:
@@ -190,6 +292,46 @@ def display_settings():
     _update_settings_xml()
     common.addon.show_settings()
         
+def _login(imp):
+    '''
+    Log in to the file hoster of a :class:`SiteAuth` plugin unless it has a
+    valid session already.
+    
+    If another thread is already logging in to the same plugin this waits for
+    it to finish and then uses that session instead of logging in again.
+    '''
+    _login_lock.acquire()
+    try:
+        state = _login_state.setdefault(imp.name, [threading.Lock(), 0])
+    finally:
+        _login_lock.release()
+    lock, logins = state[0], state[1]
+    lock.acquire()
+    try:
+        if state[1] != logins:
+            common.addon.log_debug('using login from another resolve')
+        elif not imp.is_logged_in():
+            common.addon.log_debug('logging in')
+            imp.login()
+            state[1] += 1
+    finally:
+        lock.release()
+        
+def _save_accounting(net):
+    '''
+    Adds the http request and bandwidth counters collected by 
+    :class:`t0mm0.common.net.Net` to the totals kept in the addon profile 
+    directory.
+    '''
+    try:
+        try:
+            os.makedirs(os.path.dirname(common.accounting_file))
+        except OSError:
+            pass
+        net.save_accounting(common.accounting_file)
+    except IOError:
+        common.addon.log_error('error writing ' + common.accounting_file)
+        
 def _update_settings_xml():
     '''
     This function writes a new ``resources/settings.xml`` file which contains
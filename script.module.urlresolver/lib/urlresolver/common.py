@@ -28,4 +28,6 @@ addon_path = addon.get_path()
 plugins_path = os.path.join(addon_path, 'lib', 'urlresolver', 'plugins')
 profile_path = addon.get_profile()
 settings_file = os.path.join(addon_path, 'resources', 'settings.xml')
+accounting_file = os.path.join(profile_path, 'net_accounting.json')
+quota_file = os.path.join(profile_path, 'quotas.json')
 
@@ -1,43 +1,103 @@
 '''
-Countdown XBMC 0.2
+Countdown XBMC 0.3
 Copyleft Anarchintosh
 
 Set a countdown dialog for XBMC.
 Necessary for some filehosters eg. megaupload
+
+The wait is a Deadline which starts counting when the hoster issues the link,
+the dialog is only a view of it:
+
+    deadline = Deadline(25)
+    ...do anything else that needs doing...
+    if countdown(deadline, title='megaupload'):
+        play the link
 '''
 
-import xbmc, xbmcgui
+import threading, time
+import xbmcgui
+
+class Deadline:
+    '''
+    A wait imposed by a hoster, timed from when the link was issued rather
+    than from when somebody starts waiting for it. Waiting doesn't hold any
+    locks, so other threads carry on as normal, and it finishes early if the
+    deadline is cancelled.
+    '''
+
+    def __init__(self, seconds, start=None):
+        '''
+        Args:
+            seconds (float): How long the hoster makes us wait.
+
+        Kwargs:
+            start (float): When the wait started (as returned by
+            time.time()), defaults to now.
+        '''
+        if start is None:
+            start = time.time()
+        self.seconds = seconds
+        self.end = start + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        '''Returns the number of seconds left (0 once the deadline passes).'''
+        return max(0, self.end - time.time())
+
+    def cancel(self):
+        '''Stop waiting, anyone in wait() returns False straight away.'''
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.isSet()
+
+    def wait(self, timeout=None):
+        '''
+        Block until the deadline passes or is cancelled.
+
+        Kwargs:
+            timeout (float): Give up after this many seconds.
+
+        Returns:
+            True if the deadline has passed, False if it was cancelled (or
+            the timeout ran out first).
+        '''
+        remaining = self.remaining()
+        if timeout is not None:
+            remaining = min(remaining, timeout)
+        if remaining > 0:
+            self._cancelled.wait(remaining)
+        return not self.is_cancelled() and self.remaining() == 0
 
 def countdown(time_to_wait,title='',text=''):
+    #time_to_wait can be a number of seconds (starting now) or a Deadline
+    if not isinstance(time_to_wait, Deadline):
+        time_to_wait = Deadline(time_to_wait)
     return do_xbmc_wait(time_to_wait,title,text)
 
-def do_xbmc_wait(time_to_wait,title,text):
+def do_xbmc_wait(deadline,title,text):
 
-    print 'waiting '+str(time_to_wait)+' secs'
+    print 'waiting '+str(int(deadline.remaining() + 0.999))+' secs'
 
     pDialog = xbmcgui.DialogProgress()
     ret = pDialog.create(title)
 
-    secs=0
-    percent=0
-    increment = 100 / time_to_wait
-
-    cancelled = False
-    while secs < time_to_wait:
-        secs = secs + 1
-        percent = increment*secs
-        secs_left = str((time_to_wait - secs))
+    #the dialog just shows the deadline, checking for cancel a few times a
+    #second so we stop as soon as the user gives up
+    while not deadline.wait(0.25):
+        if deadline.is_cancelled() or pDialog.iscanceled():
+            deadline.cancel()
+            break
+        remaining = deadline.remaining()
+        percent = int(100 * (1 - remaining / deadline.seconds))
+        secs_left = str(int(remaining + 0.999))
         remaining_display = ' Wait '+secs_left+' seconds for the video stream to activate...'
         pDialog.update(percent,' '+text,remaining_display)
-        xbmc.sleep(1000)
-        if (pDialog.iscanceled()):
-             cancelled = True
-             break
+    pDialog.close()
 
-    if cancelled == True:     
+    if deadline.is_cancelled():
          print 'wait cancelled'
          return False
     else:
          print 'done waiting'
          return True
-
@@ -1,4 +1,6 @@
 from t0mm0.common.net import Net
+from lib import jsunpack
+from lib import verified
 from urlresolver.plugnplay.interfaces import UrlResolver
 from urlresolver.plugnplay.interfaces import PluginSettings
 from urlresolver.plugnplay import Plugin
@@ -10,6 +12,8 @@ import os
 class TwogbhostingResolver(Plugin, UrlResolver, PluginSettings):
     implements = [UrlResolver, PluginSettings]
     name = "2gbhosting"
+    sessions = verified.SessionCache(os.path.join(common.profile_path,
+                                                  '%s.sessions' % name))
 
 
     def __init__(self):
@@ -19,9 +23,21 @@ class TwogbhostingResolver(Plugin, UrlResolver, PluginSettings):
 
 
     def get_media_url(self, web_url):
+        #skip fetching the sid if we've already got past the form for this file
+        tokens = self.sessions.get(web_url)
+        if tokens:
+            try:
+                data = { 'sid' : tokens['sid'],'submit' : 'Click Here To Continue', }
+                stream_url = self._find_stream(self.net.http_POST(web_url, data).body)
+                if stream_url:
+                    return stream_url
+            except urllib2.URLError, e:
+                pass
+            self.sessions.invalidate(web_url)
+
         data = {}
         try:
-            html = self.net.http_GET(web_url).content
+            html = self.net.http_GET(web_url).body
         except urllib2.URLError, e:
             common.addon.log_error('2gb-hosting: got http error %d fetching %s' %
                                     (e.code, web_url))
@@ -37,12 +53,28 @@ class TwogbhostingResolver(Plugin, UrlResolver, PluginSettings):
             return False
         try:
             data = { 'sid' : sid,'submit' : 'Click Here To Continue', }
-            html = self.net.http_POST(web_url, data).content
+            html = self.net.http_POST(web_url, data).body
         except urllib2.URLError, e:
             common.addon.log_error('2gbhosting: got http error %d fetching %s' %
                                     (e.code, web_url))
             return False
 
+        stream_url = self._find_stream(html)
+        if stream_url:
+            self.sessions.put(web_url, web_url, {'sid': sid})
+        return stream_url
+
+
+    def _find_stream(self, html):
+        js = jsunpack.unpack(html)
+        if js:
+            r = re.search('[\'"]file[\'"]\s*,\s*[\'"](.+?)[\'"]', js)
+            if r:
+                stream_url = r.group(1)
+                common.addon.log_error('2gbhosting: streaming url' + stream_url)
+                return stream_url
+
+        #fall back to picking the url out of the packed dictionary
         r = re.search('swf\|(.+?)\|mpl\|\d+\|(.+?)\|stretching\|autostart\|jpg\|' +
                       'exactfit\|provider\|write\|lighttpd\|.+?\|' +
                       'thumbs\|mediaspace\|(.+)\|(.+)\|(.+?)\|image\|files', html)
@@ -19,23 +19,32 @@ class DivxstageResolver(Plugin, UrlResolver, PluginSettings):
 
 
     def get_media_url(self, web_url):
+        #the src param is preferred, flashvars are only used without it
+        patterns = [re.compile('<param name="src" value="(.+?)" />'),
+                    re.compile('\'flashvars\',\'file=(.+)&type=video')]
         try:
-            html = self.net.http_GET(web_url).content
+            matches = self.net.http_GET_search(web_url, patterns,
+                                               max_bytes=32768)
+            if not (matches[0] or matches[1]):
+                #the page may just be longer than usual, search all of it
+                common.addon.log_debug('Divxstage: stream_url not in the ' +
+                                       'first 32KB, fetching the whole page')
+                html = self.net.http_GET(web_url).content
+                matches = [pattern.search(html) for pattern in patterns]
         except urllib2.URLError, e:
             common.addon.log_error('Divxstage: got http error %d fetching %s' %
                                    (e.code, web_url))
             return False
                 
-        r = re.search('<param name="src" value="(.+?)" />', html)
+        src, flashvars = matches
         stream_url = ""
-        if r:
-            stream_url = r.group(1)
+        if src:
+            stream_url = src.group(1)
         else:
             message ='Divxstage: 1st attempt at finding the stream_url failed'
             common.addon.log_error(message)
-            r = re.search("\'flashvars\',\'file=(.+)&type=video", html)
-            if r:
-                stream_url = r.group(1)
+            if flashvars:
+                stream_url = flashvars.group(1)
             else:
                 message = 'Divxstage: Giving up on finding the stream_url'
                 common.addon.log_error(message)
@@ -13,20 +13,97 @@
  __doLogin(baseurl, cookiepath, username, password)
 
  __resolveURL(url,cookiepath,aviget=True,force_megavid=True)
+   returns filelink,filename,megavidlink,logincheck,limited
 
  __dls_limited(baseurl,cookiepath)
 
+ link_limited(filelink,cookiepath)
+
  is_online(cookiepath='YOUR_COOKIE_PATH',url='THE_URL')
 
+ analyze(source,aviget=True)
+
 '''
 
-import os,re
-import urllib,urllib2,cookielib
+import os,re,threading,time,urllib2,urlparse
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+from t0mm0.common.net import Net
 
 #global strings for valid baseurl
 regular = 'http://www.megaupload.com/'
 porn = 'http://www.megaporn.com/'
 
+#the long-lived session used for all requests, see get_net()
+_net = None
+_net_lock = threading.Lock()
+
+#everything we need from a megaupload page, found in a single scan by analyze()
+_page_re = re.compile(
+    '(?P<welcome>Welcome)|' +
+    'flashvars.status = "(?P<status>premium|platinum)";|' +
+    '(?P<offline>Unfortunately, the link you have clicked is not available.)|' +
+    '(?P<limited>Download limit exceeded)|' +
+    '(?P<megaup><span class="down_txt3">Download link:</span> ' +
+    '<a href="http://www.megaupload.com/)|' +
+    '(?P<view_megavid>View on Megavideo)|' +
+    '<a href="http://www.megavideo.(?P<megavid>[^"]+)"|' +
+    '<a href="(?P<premium_link>[^"]+)" class="down_ad_butt1">|' +
+    'id="downloadlink"><a href="(?P<free_link>[^"]+)" class=')
+
+#what megaupload sends instead of the file once the download limit is reached
+_limit_re = re.compile('Download limit exceeded')
+
+class PageInfo(object):
+    #the result of analyze()
+    __slots__ = ('login', 'online', 'limited', 'filelink', 'megavid',
+                 'filename')
+
+def analyze(source,aviget=True):
+    #scans megaupload page source once and returns a PageInfo with:
+    #login - 'premium', 'free' or None if not logged in
+    #online - False if the file isn't available
+    #limited - True if the download limit has been reached
+    #filelink - direct link to the file (or None)
+    #megavid - megavideo link (or None)
+    #filename - name of the file (or None)
+    found = {}
+    for m in _page_re.finditer(source):
+        for name, value in m.groupdict().items():
+            if value is not None and name not in found:
+                found[name] = value
+
+    page = PageInfo()
+    page.online = 'offline' not in found
+    page.limited = 'limited' in found
+    if 'welcome' not in found:
+        page.login = None
+    elif 'status' in found:
+        page.login = 'premium'
+    else:
+        page.login = 'free'
+
+    if page.login == 'premium':
+        url = found.get('premium_link')
+    else:
+        url = found.get('free_link')
+    #aviget is an option where if a .divx file is found, it is renamed to .avi (necessary for XBMC)
+    if url and aviget is True and url.endswith('divx'):
+        url = url[:-4]+'avi'
+    page.filelink = url
+    page.filename = url and _get_filename(url)
+
+    page.megavid = None
+    if 'megaup' in found and 'view_megavid' in found and 'megavid' in found:
+        page.megavid = 'http://www.megavideo.' + found['megavid']
+    return page
+
 def setBaseURL(baseurl):
     # API feature to neaten up how functions are used
     if baseurl == 'regular':
@@ -61,11 +138,7 @@ def checkurl(url):
 def is_online(cookiepath=None,url=False,source=False):
     if source == False:
         source = GetURL(url,cookiepath)
-    checker = re.search('Unfortunately, the link you have clicked is not available.',source)
-    if checker is not None:
-        return False
-    elif checker is None:
-        return True
+    return analyze(source).online
 
 def get_dir(mypath, dirname):
     #...creates sub-directories if they are not found.
@@ -77,19 +150,19 @@ def get_dir(mypath, dirname):
 
 def megavid_force(url):
     #load a megaup page without cookies, to ensure that the user can get the megavid link.
-        source=load_pagesrc(url,enable_cookies=False)
-        megavidlink=get_megavid(source)
-        return megavidlink
+        source=GetURL(url,None,enable_cookies=False)
+        return analyze(source).megavid
     
 def resolveURL(url,cookiepath,aviget=True,force_megavid=True):
 
         #bring together all the functions into a simple addon-friendly function.
 
-        source=load_pagesrc(url,cookiepath,enable_cookies=True)
+        source=GetURL(url,cookiepath,enable_cookies=True)
         
         #if source is a url (from a Direct Downloads re-direct) not pagesource
         if source.startswith('http://'):
             filelink=source
+            filename=_get_filename(filelink)
             '''
             Can't get megavid link if using direct download
             However, as a workaround, can load megaup page without cookies, then scrape.
@@ -101,21 +174,21 @@ def resolveURL(url,cookiepath,aviget=True,force_megavid=True):
             
             #speed patch (we know its premium, since we're getting a direct download)
             logincheck='premium'
+            limited=False
 
         else: # if source is html page code...
 
-            #scrape the direct filelink from page
-            filelink=get_filelink(source,aviget)
-
-            #scrape the megavideo link if there is one on the page
-            megavidlink=get_megavid(source)
-
-            #verify what the user is logged in as.
-            logincheck=check_login(source)
-
-        filename=_get_filename(filelink)
+            #scrape everything we need from the page in one go
+            page=analyze(source,aviget)
+            if not page.online:
+                return False
+            filelink=page.filelink
+            filename=page.filename
+            megavidlink=page.megavid
+            logincheck=page.login
+            limited=page.limited
         
-        return filelink,filename,megavidlink,logincheck
+        return filelink,filename,megavidlink,logincheck,limited
 
 
 def load_pagesrc(url,cookiepath,enable_cookies=True):
@@ -127,7 +200,7 @@ def load_pagesrc(url,cookiepath,enable_cookies=True):
 
         source=GetURL(url,cookiepath,enable_cookies)
         
-        if is_online(source=source) == True:
+        if source.startswith('http://') or analyze(source).online:
             return source
         else:
             return False
@@ -139,96 +212,66 @@ def check_login(source):
         #feed me some megaupload page source
         #returns 'free' or 'premium' if logged in
         #returns 'none' if not logged in
-        
-        login = re.search('Welcome', source)
-        premium = re.search('flashvars.status = "premium";', source)
-        platinum = re.search('flashvars.status = "platinum";', source)       
-
-        if login is not None:
-            if premium is not None:
-                return 'premium'
-            elif premium is None:
-                if platinum is not None:
-                    return 'premium'
-                elif platinum is None:
-                    return 'free'
-        elif login is None:
-            return None
+        return analyze(source).login
 
 def __dls_limited(baseurl,cookiepath):
     #returns True if download limit has been reached.
 
     baseurl=setBaseURL(baseurl)
 
-    truestring='Download limit exceeded'
-    falsestring='Hooray Download Success'   
-
     #url to a special small text file that contains the words: Hooray Download Success
     if baseurl == regular:
         testurl = 'http://www.megaupload.com/?d=PQCIEIP7'
     elif baseurl == porn:
         testurl = ''
 
-    source=load_pagesrc(testurl)
-    fileurl=get_filelink(source)
-
-    link=GetURL(cookiepath,fileurl)
-
-    exceeded = re.search(truestring, link)
-    #notexceeded = re.search(falsestring, link)
-
-    if exceeded is not None:
-        return True
+    source=load_pagesrc(testurl,cookiepath)
+    if not source or source.startswith('http://'):
+        fileurl=source
     else:
-        #if notexceeded is not None:
-            return False
+        fileurl=get_filelink(source)
+
+    return link_limited(fileurl,cookiepath)
+
+def link_limited(filelink,cookiepath=None):
+    #returns True if megaupload answers a file link with its download limit
+    #message instead of the file. only the start of the response is fetched
+    #and the connection is then dropped.
+    #this is an extra request for the file before the player's, so it adds
+    #latency and megaupload may count it against the quota it is checking
+    #(a partial download, but we can't tell how it is counted). callers 
+    #should only use it when the user asked for it.
+    if not filelink:
+        return False
+    try:
+        exceeded = get_net(cookiepath).http_GET_search(filelink, _limit_re,
+                                                       max_bytes=16384)
+    except urllib2.URLError:
+        #we can't tell, let the player find out
+        return False
+    return exceeded is not None
 
 def delete_login(cookiepath):
     #clears cookies
-    try:
-        os.remove(cookiepath)
-    except:
-        pass
+    for baseurl in (regular, porn):
+        try:
+            Net._cj.clear(_cookie_domain(baseurl))
+        except KeyError:
+            pass
+    for path in (cookiepath, _account_file(cookiepath)):
+        try:
+            os.remove(path)
+        except:
+            pass
     
 def get_megavid (source):
-        #verify source is megaupload 
-        checker='<span class="down_txt3">Download link:</span> <a href="http://www.megaupload.com/'
-        ismegaup=re.search(checker, source)
-
-        if ismegaup is not None:
-        #scrape for megavideo link (first check its there)
-            megavid = re.search('View on Megavideo', source)
-
-        if megavid is None:
-            #no megavideo link on page
-            return None
-            
-        else:
-            megavidlink = 'http://www.megavideo.' + ((re.compile('<a href="http://www.megavideo.(.+?)"').findall(source))[0])
-            return megavidlink      
-
-        if ismegaup is None:
-            return None
+        #returns the megavideo link from megaupload page source, or None
+        return analyze(source).megavid
 
 
 def get_filelink(source,aviget=True):
-        # load megaupload page and scrapes and adds videolink, passes through partname.  
-        #print 'getting file link....'
-
-        login = check_login(source)
-
-        if login == 'premium':
-            #get the premium link.
-            url = (re.compile('<a href="(.+?)" class="down_ad_butt1">').findall(source))[0]
-
-        if login == 'free' or login == None:
-            url = (re.compile('id="downloadlink"><a href="(.+?)" class=').findall(source))[0]
-
-        #aviget is an option where if a .divx file is found, it is renamed to .avi (necessary for XBMC)
-        if aviget is True and url.endswith('divx'):
-                return url[:-4]+'avi'
-        else:       
-                return url
+        # scrapes the videolink from megaupload page source, passes through partname.  
+        return analyze(source,aviget).filelink
 
 
 def _get_filename(url=False,source=False):
@@ -242,69 +285,147 @@ def _get_filename(url=False,source=False):
         return name[-1]
 
 
+def get_net(cookiepath=None):
+    #returns the Net session shared by all megaupload requests, the saved
+    #login cookies are loaded the first time it is used.
+    global _net
+    _net_lock.acquire()
+    try:
+        if _net is None:
+            _net = Net()
+            if cookiepath is not None and os.path.exists(cookiepath):
+                _net.set_cookies(cookiepath)
+        return _net
+    finally:
+        _net_lock.release()
+
+
+def _cookie_domain(baseurl):
+    return '.' + urlparse.urlparse(baseurl).netloc.split('www.', 1)[-1]
+
+
+def _account_file(cookiepath):
+    #which account each login in cookiepath belongs to is saved next to it
+    return cookiepath + '.account'
+
+
+def _account_key(username, password):
+    #identifies the credentials a login was made with, without saving them
+    account = u'%s\0%s' % (username, password)
+    return sha1(account.encode('utf-8')).hexdigest()
+
+
+def _load_accounts(cookiepath):
+    #returns {baseurl: {'account': _account_key(), 'tier': tier}}
+    try:
+        f = open(_account_file(cookiepath))
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+
+
+def _save_account(baseurl, cookiepath, account, tier):
+    accounts = _load_accounts(cookiepath)
+    accounts[baseurl] = {'account': account, 'tier': tier}
+    try:
+        f = open(_account_file(cookiepath), 'w')
+        try:
+            json.dump(accounts, f)
+        finally:
+            f.close()
+    except IOError:
+        pass
+
+
+def is_logged_in(baseurl, cookiepath=None, username=None, password=None):
+    #returns True if there is a login cookie for baseurl which hasn't expired
+    #yet, without contacting the site. if username and password are given 
+    #the login also has to have been made with them.
+    baseurl=setBaseURL(baseurl) or baseurl
+    get_net(cookiepath)
+    if username is not None or password is not None:
+        saved = _load_accounts(cookiepath).get(baseurl, {})
+        if saved.get('account') != _account_key(username, password):
+            return False
+    now = time.time()
+    domain = _cookie_domain(baseurl)
+    for cookie in Net._cj:
+        if (cookie.name == 'user' and cookie.domain.endswith(domain) and
+            not cookie.is_expired(now)):
+            return True
+    return False
+
+
 def doLogin(baseurl, cookiepath, username, password):
 
     baseurl=setBaseURL(baseurl)
 
     if username and password:
-        #delete the old cookie
+        #reuse the current login until its cookie expires, as long as it was
+        #made with the same username and password
+        if is_logged_in(baseurl, cookiepath, username, password):
+            #None if we don't know the tier, the next page we load will tell
+            return _load_accounts(cookiepath).get(baseurl, {}).get('tier')
+
+        #don't let cookies from another account get mixed up with this one
         try:
-            os.remove(cookiepath)
-        except:
+            Net._cj.clear(_cookie_domain(baseurl))
+        except KeyError:
             pass
 
-        #build the login code, from user, pass, baseurl and cookie
-        login_data = urllib.urlencode({'username' : username, 'password' : password, 'login' : 1, 'redir' : 1}) 
-        req = urllib2.Request(baseurl + '?c=login', login_data)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows; U; Windows NT 5.1; en-GB; rv:1.9.0.3) Gecko/2008092417 Firefox/3.0.3')
-        cj = cookielib.LWPCookieJar()
-        opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cj))
-
         #do the login and get the response
-        response = opener.open(req)
-        source = response.read()
-        response.close()
+        net = get_net(cookiepath)
+        source = net.http_POST(baseurl + '?c=login', 
+                               {'username' : username, 'password' : password, 
+                                'login' : 1, 'redir' : 1}).body
 
-        login = check_login(source)
+        login = analyze(source).login
 
         if login == 'free' or login == 'premium':
-            cj.save(cookiepath)
+            net.save_cookies(cookiepath)
+            _save_account(baseurl, cookiepath,
+                          _account_key(username, password), login)
 
         return login
     else:
         return None
                 
 
+def _get_location(response):
+    #returns where a redirect response points, or None if it isn't one
+    for header in response.get_headers():
+        name, sep, value = header.partition(':')
+        if name.strip().lower() == 'location':
+            return value.strip()
+    return None
+
+
 def GetURL(url,cookiepath,enable_cookies=True):
     #print 'processing url: '+url
+    net = get_net(cookiepath)
 
     # use cookie, if logged in.
-    if enable_cookies==True and cookiepath is not None and os.path.exists(cookiepath):
-        cj = cookielib.LWPCookieJar()
-        cj.load(cookiepath)
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows; U; Windows NT 5.1; en-GB; rv:1.9.0.3) Gecko/2008092417 Firefox/3.0.3')   
-        opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cj))
-        response = opener.open(req)
-
-        #check if we might have been redirected (megapremium Direct Downloads...)
-        finalurl = response.geturl()
-
-        #if we weren't redirected, return the page source
-        if finalurl is url:
-            link=response.read()
-            response.close()
-            return link
-
-        #if we have been redirected, return the redirect url
-        elif finalurl is not url:               
-            return finalurl
+    if enable_cookies==True and cookiepath is not None:
+        #premium accounts with Direct Downloads get redirected straight to
+        #the file, so don't follow redirects and see where we would end up
+        if is_logged_in(url, cookiepath):
+            response = net.http_GET(url, follow_redirects=False)
+            finalurl = _get_location(response)
+            if finalurl is None:
+                return response.body
+
+            #if we have been redirected to the file, return the redirect url
+            finalurl = urlparse.urljoin(url, finalurl)
+            if '?d=' not in finalurl:
+                return finalurl
+            url = finalurl
+
+        return net.http_GET(url).body
 
     # don't use cookie, if not logged in        
     else:
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows; U; Windows NT 5.1; en-GB; rv:1.9.0.3) Gecko/2008092417 Firefox/3.0.3')   
-        response = urllib2.urlopen(req)
-        link=response.read()
-        response.close()
-        return link
+        #an empty cookie header stops the shared cookie jar adding ours
+        return net.http_GET(url, headers={'Cookie': ''}).body
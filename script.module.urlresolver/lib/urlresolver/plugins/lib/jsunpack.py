@@ -0,0 +1,126 @@
+"""
+    urlresolver XBMC Addon
+    Copyright (C) 2011 t0mm0
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Unpacker for javascript packed with Dean Edwards' packer, ie. code which 
+looks like::
+
+    eval(function(p,a,c,k,e,d){...}('0 1=\'2\';',3,3,'var|x|y'.split('|'),0,{}))
+
+Shared by resolver plugins so each one doesn't need its own copy.
+
+    from lib import jsunpack
+    js = jsunpack.unpack(html)
+"""
+
+import re
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+_packed_re = re.compile(r"}\s*\(\s*'((?:[^'\\]|\\.)*)'\s*,\s*(\d+)\s*,\s*" +
+                        r"(\d+)\s*,\s*'((?:[^'\\]|\\.)*)'\.split\('\|'\)", 
+                        re.DOTALL)
+_word_re = re.compile(r'\b\w+\b')
+_escape_re = re.compile(r"\\([\\'])")
+
+#unpacked code by md5 of the packed payload
+_cache = {}
+_cache_size = 50
+
+
+def unpack(html):
+    '''
+    Find and unpack all packed javascript in a page.
+    
+    Args:
+        html (str): Page source (or just the packed javascript).
+        
+    Returns:
+        The unpacked javascript (if there was more than one packed script 
+        they are joined with newlines) or ``None`` if there isn't any. 
+        Scripts packed with a radix we can't handle are skipped.
+    '''
+    unpacked = []
+    for p, radix, count, words in _packed_re.findall(html):
+        try:
+            unpacked.append(unpack_payload(p, int(radix), int(count), words))
+        except ValueError:
+            pass
+    if not unpacked:
+        return None
+    return '\n'.join(unpacked)
+    
+
+def unpack_payload(p, radix, count, words):
+    '''
+    Unpack the arguments passed to the packer's ``function(p,a,c,k,e,d)``.
+    
+    Every word in ``p`` is read as a number in base ``radix`` and replaced 
+    by that entry of the dictionary, all in a single pass. Results are 
+    cached so unpacking the same payload again is free.
+    
+    Args:
+        p (str): The packed code, as it appears between the quotes.
+        
+        radix (int): The base the words are encoded in (2 to 62).
+        
+        count (int): The number of words in the dictionary.
+        
+        words (str or list): The ``|`` separated dictionary.
+        
+    Returns:
+        The unpacked javascript.
+        
+    Raises:
+        ValueError: If ``radix`` isn't supported.
+    '''
+    if not isinstance(words, basestring):
+        words = '|'.join(words)
+    if not 2 <= radix <= len(ALPHABET):
+        raise ValueError('unsupported radix: %d' % radix)
+    key = md5('%s\0%d\0%d\0%s' % (p, radix, count, words)).hexdigest()
+    js = _cache.get(key)
+    if js is not None:
+        return js
+    
+    words = _escape_re.sub(r'\1', words).split('|')
+    digits = dict((c, i) for i, c in enumerate(ALPHABET[:radix]))
+    
+    def lookup(match):
+        token = match.group(0)
+        if len(token) > 1 and token[0] == '0':
+            return token
+        index = 0
+        for c in token:
+            digit = digits.get(c)
+            if digit is None:
+                return token
+            index = index * radix + digit
+        if index < count and index < len(words) and words[index]:
+            return words[index]
+        return token
+        
+    js = _word_re.sub(lookup, _escape_re.sub(r'\1', p))
+    if len(_cache) >= _cache_size:
+        _cache.clear()
+    _cache[key] = js
+    return js
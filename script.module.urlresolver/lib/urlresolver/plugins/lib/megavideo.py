@@ -14,137 +14,189 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>. '''
  
-import urllib2,re
+import re,threading,time
+from t0mm0.common.net import Net
 __version__ = "1.0.0"
 
-try:
-	if bin(0): pass
-except NameError, ne:
-	def bin(x):
-		'''
-		bin(number) -> string
-
-		Stringifies an int or long in base 2.
-		'''
-		if x < 0: return '-' + bin(-x)
-		out = []
-		if x == 0: out.append('0')
-		while x > 0:
-			out.append('01'[x & 1])
-			x >>= 1
-			pass
-		try: return '0b' + ''.join(reversed(out))
-		except NameError, ne2: out.reverse()
-		return '0b' + ''.join(out)
+_k1_re = re.compile('k1="([0-9]+)"', re.I)
+_k2_re = re.compile('k2="([0-9]+)"', re.I)
+_un_re = re.compile('un="(.+?)"', re.I)
+_attr_re = re.compile(r'([\w:-]+)="([^"]*)"')
+
+def _keys(k1, k2):
+	'''
+	_keys(k1, k2) -> list
+
+	The 384 numbers generated from the k1 and k2 values of a video.
+	'''
+	keys = []
+	for index in xrange(384):
+		k1 = (k1 * 11 + 77213) % 81371
+		k2 = (k2 * 17 + 92717) % 192811
+		keys.append((k1 + k2) % 128)
+	return keys
+
+def decrypt(un, k1, k2, keys=None):
+	'''
+	decrypt(un, k1, k2) -> string
+
+	Decrypts the un value of a video with its k1 and k2 values, working on
+	the 128 bits of un as one integer. Bit 0 of the key is the most
+	significant bit.
+	'''
+	if keys is None:
+		keys = _keys(int(k1), int(k2))
+	value = int(un, 16)
+	width = 128
+	while value >> width:
+		width += 1
+	top = width - 1
+
+	for index in xrange(256, -1, -1):
+		a = top - keys[index]
+		b = top - index % 128
+		if ((value >> a) ^ (value >> b)) & 1:
+			value ^= (1 << a) | (1 << b)
+
+	mask = 0
+	for index in xrange(128):
+		mask |= (keys[index + 256] & 1) << (top - index)
+	return "%x" % (value ^ mask)
+
+def decrypt_many(XML_FILES):
+	'''
+	decrypt_many(list) -> list
+
+	Decrypts the videolink.php responses in XML_FILES, returning the
+	decrypted strings in the same order (None for responses without keys).
+	Keys are only generated once for responses which share k1 and k2.
+	'''
+	results = []
+	key_cache = {}
+	for XML_FILE in XML_FILES:
+		k1 = _k1_re.search(XML_FILE)
+		k2 = _k2_re.search(XML_FILE)
+		un = _un_re.search(XML_FILE)
+		if not (k1 and k2 and un):
+			results.append(None)
+			continue
+		k1, k2 = int(k1.group(1)), int(k2.group(1))
+		keys = key_cache.get((k1, k2))
+		if keys is None:
+			keys = key_cache[(k1, k2)] = _keys(k1, k2)
+		results.append(decrypt(un.group(1).replace("+"," "), k1, k2, keys))
+	return results
+
+class VideoInfo(object):
+	'''
+	Everything needed from a videolink.php response, parsed in one pass.
+	'''
+	__slots__ = ('server', 'title', 'runtime', 'k1', 'k2', 'un', 'error',
+	             'decrypted', 'expires')
+
+	def __init__(self, XML_FILE):
+		attrs = {}
+		for name, value in _attr_re.findall(XML_FILE):
+			attrs.setdefault(name.lower(), value)
+		self.error = attrs.get('errortext')
+		self.server = attrs.get('s')
+		self.title = attrs.get('title', '').replace("+"," ")
+		self.runtime = attrs.get('runtimehms', '').replace("+"," ")
+		self.k1 = attrs.get('k1')
+		self.k2 = attrs.get('k2')
+		self.un = attrs.get('un', '').replace("+"," ")
+		self.decrypted = None
+		self.expires = 0
+
+	def getDecrypted(self):
+		if self.decrypted is None:
+			self.decrypted = decrypt(self.un, self.k1, self.k2)
+		return self.decrypted
+
+#VideoInfo records by video reference
+_cache = {}
+_cache_lock = threading.Lock()
+_cache_size = 50
+_cache_ttl = 600
+
+def get_info(reference, net=None):
+	'''
+	get_info(string) -> VideoInfo
+
+	Fetches and parses the videolink.php response for a video, or returns
+	the cached record if the video was looked up in the last 10 minutes.
+	'''
+	l = len(reference)
+	if(l > 8):
+		reference = reference[l-8 : l]
+	now = time.time()
+	_cache_lock.acquire()
+	try:
+		info = _cache.get(reference)
+	finally:
+		_cache_lock.release()
+	if info is not None and info.expires > now:
+		return info
+
+	net = net or Net()
+	info = VideoInfo(net.http_GET(Megavideo.URL + "?v=" + reference).content)
+	if not info.error:
+		info.expires = now + _cache_ttl
+		_cache_lock.acquire()
+		try:
+			if len(_cache) >= _cache_size:
+				for key in [k for k, v in _cache.items() if v.expires <= now]:
+					del _cache[key]
+			if len(_cache) >= _cache_size:
+				_cache.clear()
+			_cache[reference] = info
+		finally:
+			_cache_lock.release()
+	return info
 
 class Megavideo:
 	URL = "http://www.megavideo.com/xml/videolink.php"
 
-	def __init__(self,reference):
-		l = len(reference)
-		if(l > 8):
-			reference = reference[l-8 : l]
-	
-		xml_url = self.URL+"?v="+str(reference)		
-		self.XML_FILE = urllib2.urlopen(xml_url).read()
+	def __init__(self,reference,net=None):
+		self.info = get_info(reference, net)
 
 	def getLink(self):
-		try:	self.decrypted
-		except:	self.decrypted = Megavideo_Decrypt(self.XML_FILE)
-		return "http://www" + str(self.getServer()) + ".megavideo.com/files/" + str(self.decrypted.getDecrypted()) + "/"
+		return "http://www" + str(self.getServer()) + ".megavideo.com/files/" + str(self.info.getDecrypted()) + "/"
 
 	def getFLV(self):
-		try:	self.decrypted
-		except:	self.decrypted = Megavideo_Decrypt(self.XML_FILE)
-		return	"http://www" + str(self.getServer()) + ".megavideo.com/files/" + str(self.decrypted.getDecrypted()) + "/index.flv"
+		return self.getLink() + "index.flv"
 
 	def is_valid(self):
-		error = re.findall('errortext="(.+?)"',self.XML_FILE,re.I)
-
-		if len(error)>0:
-			print "ERROR: " + str(error)
+		if self.info.error:
+			print "ERROR: " + str([self.info.error])
 			return False
 		else:
 			return True
 
 	def getServer(self):
-		self.server = re.findall('s="([0-9]+)"',self.XML_FILE,re.I)[0]
-		return self.server
+		return self.info.server
 
 	def getTitle(self):
-		self.title = re.findall('title="(.+?)"',self.XML_FILE,re.I)[0].replace("+"," ")
-		return self.title
+		return self.info.title
 
 	def getRuntime(self):
-		self.runtime = re.findall('runtimehms="(.+?)"',self.XML_FILE,re.I)[0].replace("+"," ")
-		return self.runtime
+		return self.info.runtime
 
 	def getAllInfo(self):
-		self.info = {}
-
-		try: 	self.title
-		except:	self.info["Title"] = self.getTitle()
-		else:	self.info["Title"] = self.title
-
-		try: 	self.server
-		except:	self.info["Server"] = self.getServer()
-		else:	self.info["Server"] = self.server
-
-		try: 	self.runtime
-		except:	self.info["Runtime"] = self.getRuntime()
-		else:	self.info["Runtime"] = self.runtime	
-
-		return self.info
+		return {"Title": self.info.title, "Server": self.info.server,
+		        "Runtime": self.info.runtime}
 
 class Megavideo_Decrypt:
 	def __init__(self,XML_FILE):
 		self.XML_FILE = XML_FILE
 		self.setKeys()
 
-		tobin = self.hex2bin(self.un)
-		keys = []
-		index = 0
-
-		while (index < 384):
-			self.k1 = ((int(self.k1) * 11) + 77213) % 81371
-			self.k2 = ((int(self.k2) * 17) + 92717) % 192811
-			keys.append((int(self.k1) + int(self.k2)) % 128)
-			index += 1
-
-		index = 256
-
-		while (index >= 0):
-			val1 = keys[index]
-			mod  = index%128
-			val2 = tobin[val1]
-			tobin[val1] = tobin[mod]
-			tobin[mod] = val2
-			index -= 1
-
-		index = 0
-		while(index<128):
-			tobin[index] = int(tobin[index]) ^ int(keys[index+256]) & 1
-			index += 1
-
-		self.decrypted = self.bin2hex(tobin)
+		self.decrypted = decrypt(self.un, self.k1, self.k2)
 
 	def setKeys(self):
-		self.k1 = re.findall('k1="([0-9]+)"',self.XML_FILE,re.I)[0].replace("+"," ")
-		self.k2 = re.findall('k2="([0-9]+)"',self.XML_FILE,re.I)[0].replace("+"," ")
-		self.un = re.findall('un="(.+?)"',self.XML_FILE,re.I)[0].replace("+"," ")
+		self.k1 = _k1_re.findall(self.XML_FILE)[0]
+		self.k2 = _k2_re.findall(self.XML_FILE)[0]
+		self.un = _un_re.findall(self.XML_FILE)[0].replace("+"," ")
 
 	def getDecrypted(self):
 		return self.decrypted
-
-	def hex2bin(self,val):
-		bin_array = []
-		string =  bin(int(val, 16))[2:].zfill(128)
-		for value in string:
-			bin_array.append(value)
-		return bin_array
-
-	def bin2hex(self,val):
-		string = str("")
-		for char in val:
-			string+=str(char)
-		return "%x" % int(string, 2)
@@ -0,0 +1,154 @@
+"""
+    urlresolver XBMC Addon
+    Copyright (C) 2011 t0mm0
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Shared code for hosters whose pages set flashvars.file and flashvars.filekey
+(and sometimes flashvars.domain) and then get the stream url from
+player.api.php, eg. novamov and videoweed.
+
+This is a mixin rather than a plugin so it doesn't get registered itself::
+
+    from lib.playerapi import PlayerApiResolver
+
+    class MyResolver(PlayerApiResolver, Plugin, UrlResolver, PluginSettings):
+        implements = [UrlResolver, PluginSettings]
+        name = "myhoster"
+        api_url = ('http://www.myhoster.com/api/player.api.php?' +
+                   'key=%(filekey)s&file=%(file)s')
+"""
+
+import re
+import threading
+import time
+import urllib2
+from urlresolver import common
+
+_flashvars_re = re.compile(r'flashvars\.(domain|file|filekey)\s*=\s*"(.*?)"')
+_stream_re = re.compile('url=(.+?)&title')
+
+
+class _TTLCache:
+    '''A dictionary whose items are forgotten after ``ttl`` seconds.'''
+
+    def __init__(self, ttl, size=100):
+        self.ttl = ttl
+        self.size = size
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[key]
+                return None
+            return item[1]
+        finally:
+            self._lock.release()
+
+    def put(self, key, value):
+        self._lock.acquire()
+        try:
+            if len(self._items) >= self.size:
+                now = time.time()
+                for k, item in self._items.items():
+                    if item[0] < now:
+                        del self._items[k]
+                if len(self._items) >= self.size:
+                    self._items.clear()
+            self._items[key] = (time.time() + self.ttl, value)
+        finally:
+            self._lock.release()
+
+#flashvars by web url and stream urls by file id, shared by all plugins
+_pages = _TTLCache(300)
+_streams = _TTLCache(60)
+
+
+class PlayerApiResolver(object):
+    '''
+    Implements :meth:`UrlResolver.get_media_url` for player.api.php hosters.
+    Plugins using it need to set :attr:`api_url` and (as always) a ``name``
+    and ``self.net``.
+
+    The flashvars scraped from a page are cached for 5 minutes and stream
+    urls for a minute, so resolving the same video again within that time
+    skips the page (the api call then goes out on the connection kept alive
+    from last time) or doesn't need any requests at all.
+    '''
+
+    api_url = ''
+    '''
+    (str) The api url, ``%(domain)s``, ``%(file)s`` and ``%(filekey)s`` are
+    replaced with the flashvars from the page.
+    '''
+
+    required_flashvars = ('file', 'filekey')
+    '''(tuple) The flashvars the api url needs.'''
+
+    def get_media_url(self, web_url):
+        flashvars = _pages.get(web_url)
+        if flashvars is None:
+            flashvars = self._get_flashvars(web_url)
+            if not flashvars:
+                return False
+            _pages.put(web_url, flashvars)
+
+        key = (self.name, flashvars['file'])
+        stream_url = _streams.get(key)
+        if stream_url:
+            return stream_url
+
+        #get stream url from api
+        api = self.api_url % flashvars
+        try:
+            html = self.net.http_GET(api).body
+        except urllib2.URLError, e:
+            common.addon.log_error('%s: got http error %d fetching %s' %
+                                   (self.name, getattr(e, 'code', 0), api))
+            return False
+
+        r = _stream_re.search(html)
+        if not r:
+            common.addon.log_error('%s: stream url not found' % self.name)
+            return False
+        stream_url = r.group(1)
+        _streams.put(key, stream_url)
+        return stream_url
+
+    def _get_flashvars(self, web_url):
+        '''Returns the flashvars set by the page (in one pass) or None.'''
+        try:
+            html = self.net.http_GET(web_url).body
+        except urllib2.URLError, e:
+            common.addon.log_error('%s: got http error %d fetching %s' %
+                                   (self.name, getattr(e, 'code', 0), web_url))
+            return None
+
+        flashvars = {}
+        for name, value in _flashvars_re.findall(html):
+            flashvars.setdefault(name, value)
+        for name in self.required_flashvars:
+            if not flashvars.get(name):
+                common.addon.log_error('%s: flashvars.%s not found' %
+                                       (self.name, name))
+                return None
+        return flashvars
@@ -0,0 +1,159 @@
+"""
+    urlresolver XBMC Addon
+    Copyright (C) 2011 t0mm0
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Cache of sessions which have got past a hoster's human verification form.
+
+Lots of hosters make you GET a page, scrape some hidden inputs and POST them
+back before they show the link. Once that is done the cookies they set (and
+sometimes the scraped values) are good for a while, so plugins can remember
+them and go straight to the last step next time::
+
+    from lib import verified
+    sessions = verified.SessionCache(path_to_file)
+
+    tokens = sessions.get(key)
+    if tokens is None:
+        ...do the verification...
+        sessions.put(key, web_url, {'hash': session_hash})
+
+If the shortcut doesn't work, call ``sessions.invalidate(key)`` and do the
+verification again.
+"""
+
+import os
+import pickle
+import threading
+import time
+import urlparse
+from t0mm0.common.net import Net
+
+
+class SessionCache:
+    '''
+    Verified sessions (scraped tokens plus the cookies the hoster set) by key,
+    saved to a file so they survive between plays.
+    '''
+
+    def __init__(self, path=None, ttl=600):
+        '''
+        Kwargs:
+            path (str): Full path of the file to save sessions in, or None to
+            only keep them in memory.
+
+            ttl (int): Number of seconds a session is assumed to be valid for
+            (less if one of its cookies expires sooner).
+        '''
+        self.path = path
+        self.ttl = ttl
+        self._sessions = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        Returns the tokens saved for ``key`` (restoring the session's cookies)
+        or None if there isn't a valid session.
+        '''
+        self._lock.acquire()
+        try:
+            session = self._load().get(key)
+        finally:
+            self._lock.release()
+        if session is None or session['expires'] < time.time():
+            return None
+        for cookie in session['cookies']:
+            Net._cj.set_cookie(cookie)
+        return session['tokens']
+
+    def put(self, key, url, tokens=None):
+        '''
+        Save a session which has just been verified.
+
+        Args:
+            key (str): What to save it under, eg. the host name if a session
+            works for every file, or the web url if it only works for one.
+
+            url (str): A url on the hoster, the cookies for its host are
+            saved with the session.
+
+        Kwargs:
+            tokens (dict): Any scraped values needed to use the session.
+        '''
+        host = urlparse.urlparse(url)[1].split(':')[0]
+        now = time.time()
+        expires = now + self.ttl
+        cookies = []
+        for cookie in Net._cj:
+            domain = cookie.domain.lstrip('.')
+            if cookie.is_expired(now):
+                continue
+            if host == domain or host.endswith('.' + domain):
+                cookies.append(cookie)
+                if cookie.expires:
+                    expires = min(expires, cookie.expires)
+        self._lock.acquire()
+        try:
+            sessions = self._load()
+            sessions[key] = {'tokens': tokens or {}, 'cookies': cookies,
+                             'expires': expires}
+            self._save()
+        finally:
+            self._lock.release()
+
+    def invalidate(self, key):
+        '''Forget the session saved under ``key``.'''
+        self._lock.acquire()
+        try:
+            if self._load().pop(key, None) is not None:
+                self._save()
+        finally:
+            self._lock.release()
+
+    def _load(self):
+        if self._sessions is None:
+            self._sessions = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    f = open(self.path, 'rb')
+                    try:
+                        self._sessions = pickle.load(f)
+                    finally:
+                        f.close()
+                except Exception:
+                    self._sessions = {}
+        return self._sessions
+
+    def _save(self):
+        now = time.time()
+        for key, session in self._sessions.items():
+            if session['expires'] < now:
+                del self._sessions[key]
+        if not self.path:
+            return
+        try:
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except OSError:
+                pass
+            f = open(self.path, 'wb')
+            try:
+                pickle.dump(self._sessions, f, 2)
+            finally:
+                f.close()
+        except IOError:
+            pass
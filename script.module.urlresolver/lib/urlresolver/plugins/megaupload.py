@@ -22,12 +22,13 @@ import re
 import urllib2
 
 from lib import _megaupload
-from urlresolver.countdown import countdown
+from urlresolver.countdown import countdown, Deadline
 from urlresolver.plugnplay.interfaces import UrlResolver
 from urlresolver.plugnplay.interfaces import SiteAuth
 from urlresolver.plugnplay.interfaces import PluginSettings
 from urlresolver.plugnplay import Plugin
 from urlresolver import common
+from urlresolver import quota
 import xbmc
 
 class MegaUploadResolver(Plugin, UrlResolver, SiteAuth, PluginSettings):
@@ -47,15 +48,47 @@ class MegaUploadResolver(Plugin, UrlResolver, SiteAuth, PluginSettings):
 
     #UrlResolver methods
     def get_media_url(self, web_url):
-        media_url = _megaupload.resolveURL(web_url, self.cookie_file)
-        common.addon.log_debug('login type: %s' % self.login_type)
+        media_url = _megaupload.resolveURL(web_url, self.cookie_file,
+                                           force_megavid=False)
+        if not media_url:
+            common.addon.log_error('megaupload: file not found')
+            return False
+        login_type = media_url[3]
+        quota.set_tier(self.name, login_type)
+        if media_url[4]:
+            #no point making the user wait for a link that won't play
+            common.addon.log_error('megaupload: download limit exceeded')
+            quota.set_limited(self.name)
+            return False
+        if not media_url[0]:
+            common.addon.log_error('megaupload: file not found')
+            return False
+        common.addon.log_debug('login type: %s' % login_type)
         ok = True
-        if self.login_type == 'free':
-            ok = countdown(25, title='megaupload',
-                           text='loading video from free account')
-        elif not self.login_type:
-            ok = countdown(45, title='megaupload',
-                           text='loading video with no account')
+        if login_type != 'premium':
+            #the wait starts as soon as megaupload gives us the link
+            if login_type == 'free':
+                deadline = Deadline(25)
+                text = 'loading video from free account'
+            else:
+                deadline = Deadline(45)
+                text = 'loading video with no account'
+            #megaupload only says the limit is reached when the link is 
+            #fetched. checking costs an extra request on every play, so it
+            #is off unless the user turns it on, see link_limited()
+            if (self.get_setting('check_limit') == 'true' and
+                _megaupload.link_limited(media_url[0], self.cookie_file)):
+                common.addon.log_error('megaupload: download limit exceeded')
+                quota.set_limited(self.name)
+                return False
+            #there must be a better way of doing this
+            #xbmc freezes if you load the countdown dialog too quickly, so
+            #let the first second of the wait go by (less whatever has 
+            #already been spent since the link was issued)
+            waited = deadline.seconds - deadline.remaining()
+            if waited < 1:
+                xbmc.sleep(int((1 - waited) * 1000))
+            ok = countdown(deadline, title='megaupload', text=text)
         if ok:
             return media_url[0]
         else:
@@ -66,15 +99,20 @@ class MegaUploadResolver(Plugin, UrlResolver, SiteAuth, PluginSettings):
                         '([0-9A-Z]+)', web_url)
     
     #SiteAuth methods
+    def is_logged_in(self):
+        if self.get_setting('login') != 'true':
+            #nothing to log in to
+            return True
+        return _megaupload.is_logged_in('regular', self.cookie_file,
+                                        self.get_setting('username'),
+                                        self.get_setting('password'))
+
     def login(self):
         self.login_type = None
         if self.get_setting('login') == 'true':
             self.login_type = _megaupload.doLogin('regular', self.cookie_file, 
                                                   self.get_setting('username'), 
                                                   self.get_setting('password'))
-        #there must be a better way of doing this
-        #xbmc freezes if you load the countdown dialog too quickly 
-        xbmc.sleep(1000)
 
     #PluginSettings methods
     def get_settings_xml(self):
@@ -85,4 +123,7 @@ class MegaUploadResolver(Plugin, UrlResolver, SiteAuth, PluginSettings):
         xml += 'type="text" label="username" default=""/>\n'
         xml += '<setting id="MegaUploadResolver_password" enable="eq(-2,true)" '
         xml += 'type="text" label="password" option="hidden" default=""/>\n'
+        xml += '<setting id="MegaUploadResolver_check_limit" '
+        xml += 'type="bool" label="check download limit before waiting" '
+        xml += 'default="false"/>\n'
         return xml
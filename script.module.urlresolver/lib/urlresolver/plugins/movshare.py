@@ -25,6 +25,7 @@ movshare hosts both avi and flv videos
 import re
 from t0mm0.common.net import Net
 import urllib2
+from urlresolver import common
 from urlresolver.plugnplay.interfaces import UrlResolver
 from urlresolver.plugnplay.interfaces import PluginSettings
 from urlresolver.plugnplay import Plugin
@@ -41,23 +42,31 @@ class MovshareResolver(Plugin, UrlResolver, PluginSettings):
 
     def get_media_url(self, web_url):
         """ Human Verification """
+        """movshare can do both flv and avi. There is no way I know before hand
+        if the url going to be a flv or avi, so look for both (the avi is 
+        used if the page has both) and stop downloading the page once both
+        have been found.
+        "param name="src" is for avi
+        "flashvars.file=" is for flv
+        """
+        patterns = [re.compile('<param name="src" value="(.+?)"'),
+                    re.compile('flashvars.file="(.+?)"')]
         try:
             self.net.http_HEAD(web_url)
-            html = self.net.http_GET(web_url).content
+            matches = self.net.http_GET_search(web_url, patterns,
+                                               max_bytes=32768)
+            if not (matches[0] or matches[1]):
+                #the page may just be longer than usual, search all of it
+                common.addon.log_debug('movshare: stream url not in the ' +
+                                       'first 32KB, fetching the whole page')
+                html = self.net.http_GET(web_url).content
+                matches = [pattern.search(html) for pattern in patterns]
         except urllib2.URLError, e:
             common.addon.log_error('movshare: got http error %d fetching %s' %
                                   (e.code, web_url))
             return False
                
-        """movshare can do both flv and avi. There is no way I know before hand
-        if the url going to be a flv or avi. So the first regex tries to find 
-        the avi file, if nothing is present, it will check for the flv file.
-        "param name="src" is for avi
-        "flashvars.file=" is for flv
-        """
-        r = re.search('<param name="src" value="(.+?)"', html)
-        if not r:
-            r = re.search('flashvars.file="(.+?)"', html)
+        r = matches[0] or matches[1]
         if r:
             stream_url = r.group(1)
         else:
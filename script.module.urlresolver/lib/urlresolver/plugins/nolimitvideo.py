@@ -19,14 +19,19 @@ class nolimitvideoResolver(Plugin, UrlResolver, PluginSettings):
 
 
     def get_media_url(self, web_url):
+        pattern = re.compile('\'file\': \'(.+?)\',')
         try:
-            html = self.net.http_GET(web_url).content
+            r = self.net.http_GET_search(web_url, pattern, max_bytes=32768)
+            if not r:
+                #the page may just be longer than usual, search all of it
+                common.addon.log_debug('nolimitvideo: stream_url not in the ' +
+                                       'first 32KB, fetching the whole page')
+                r = pattern.search(self.net.http_GET(web_url).content)
         except urllib2.URLError, e:
             common.addon.log_error('nolimitvideo: got http error %d fetching %s' %
                                    (e.code, web_url))
             return False
                 
-        r = re.search('\'file\': \'(.+?)\',', html)
         stream_url = ""
         if r:
             stream_url = r.group(1)
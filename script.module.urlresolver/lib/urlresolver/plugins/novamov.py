@@ -18,57 +18,22 @@
 
 import re
 from t0mm0.common.net import Net
-import urllib2
-from urlresolver import common
+from lib.playerapi import PlayerApiResolver
 from urlresolver.plugnplay.interfaces import UrlResolver
 from urlresolver.plugnplay.interfaces import PluginSettings
 from urlresolver.plugnplay import Plugin
 
-class NovamovResolver(Plugin, UrlResolver, PluginSettings):
+class NovamovResolver(PlayerApiResolver, Plugin, UrlResolver, PluginSettings):
     implements = [UrlResolver, PluginSettings]
     name = "novamov"
+    api_url = ('http://www.novamov.com/api/player.api.php?' +
+               'key=%(filekey)s&file=%(file)s')
 
     def __init__(self):
         p = self.get_setting('priority') or 100
         self.priority = int(p)
         self.net = Net()
 
-    def get_media_url(self, web_url):
-        #find key
-        try:
-            html = self.net.http_GET(web_url).content
-        except urllib2.URLError, e:
-            common.addon.log_error('novamov: got http error %d fetching %s' %
-                                    (e.code, web_url))
-            return False
-
-        r = re.search('flashvars.file="(.+?)".+?flashvars.filekey="(.+?)"', 
-                      html, re.DOTALL)
-        if r:
-            filename, filekey = r.groups()
-        else:
-            common.addon.log_error('novamov: filename and filekey not found')
-            return False
-        
-        #get stream url from api
-        api = 'http://www.novamov.com/api/player.api.php?key=%s&file=%s' % \
-              (filekey, filename)
-        try:
-            html = self.net.http_GET(api).content
-        except urllib2.URLError, e:
-            common.addon.log_error('novamov: got http error %d fetching %s' %
-                                    (e.code, api))
-            return False
-
-        r = re.search('url=(.+?)&title', html)
-        if r:
-            stream_url = r.group(1)
-        else:
-            common.addon.log_error('novamov: stream url not found')
-            return False
-            
-        return stream_url
-        
     def valid_url(self, web_url):
         return re.match('http://(www.|embed.)?novamov.com/(video/|embed.php\?)' +
                         '(?:[0-9a-zA-Z]+|width)', web_url)
@@ -16,8 +16,11 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import os
 import re
+import urlparse
 from t0mm0.common.net import Net
+from lib import verified
 import urllib2
 from urlresolver import common
 from urlresolver.plugnplay.interfaces import UrlResolver
@@ -27,6 +30,8 @@ from urlresolver.plugnplay import Plugin
 class PutlockerResolver(Plugin, UrlResolver, PluginSettings):
     implements = [UrlResolver, PluginSettings]
     name = "putlocker/sockshare"
+    sessions = verified.SessionCache(os.path.join(common.profile_path,
+                                                  'putlocker.sessions'))
 
     def __init__(self):
         p = self.get_setting('priority') or 100
@@ -34,14 +39,27 @@ class PutlockerResolver(Plugin, UrlResolver, PluginSettings):
         self.net = Net()
     
     def get_media_url(self, web_url):
+        xml_url = re.sub('/(file|embed)/', '/get_file.php?stream=', web_url)
+        
+        #go straight to the download link if we're already past the form
+        host = urlparse.urlparse(web_url)[1]
+        if self.sessions.get(host) is not None:
+            try:
+                flv_url = self._get_file(xml_url)
+                if flv_url:
+                    return flv_url
+            except urllib2.URLError, e:
+                pass
+            self.sessions.invalidate(host)
+            
         #find session_hash
         try:
-            html = self.net.http_GET(web_url).content
+            r = self.net.http_GET_search(web_url, 
+                                 re.compile('value="([0-9a-f]+?)" name="hash"'))
         except urllib2.URLError, e:
             common.addon.log_error('putlocker: got http error %d fetching %s' %
                                     (e.code, web_url))
             return False
-        r = re.search('value="([0-9a-f]+?)" name="hash"', html)
         if r:
             session_hash = r.group(1)
         else:
@@ -58,22 +76,25 @@ class PutlockerResolver(Plugin, UrlResolver, PluginSettings):
             return False
         
         #find download link
-        xml_url = re.sub('/(file|embed)/', '/get_file.php?stream=', web_url)
         try:
-            html = self.net.http_GET(xml_url).content
+            flv_url = self._get_file(xml_url)
         except urllib2.URLError, e:
             common.addon.log_error('putlocker: got http error %d fetching %s' %
                                     (e.code, xml_url))
             return False
-        r = re.search('url="(.+?)"', html)
-        if r:
-            flv_url = r.group(1)
-        else:
+        if not flv_url:
             common.addon.log_error('putlocker: stream url not found')
             return False
         
+        self.sessions.put(host, web_url, {'hash': session_hash})
         return flv_url
         
+    def _get_file(self, xml_url):
+        r = re.search('url="(.+?)"', self.net.http_GET(xml_url).body)
+        if r:
+            return r.group(1)
+        return None
+        
     def valid_url(self, web_url):
         return re.match('http://(www.)?(putlocker|sockshare).com/(file|embed)' +
                         '/[0-9A-F]+', web_url)
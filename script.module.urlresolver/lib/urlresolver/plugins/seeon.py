@@ -18,7 +18,7 @@ class SeeonResolver(Plugin, UrlResolver, PluginSettings):
 
     def get_media_url(self, web_url):
         try:
-            html = self.net.http_GET(web_url).content
+            html = self.net.http_GET(web_url).body
         except urllib2.URLError, e:
             common.addon.log_error('seeon.tv: got http error %d fetching %s' %
                                     (e.code, web_url))
@@ -35,7 +35,7 @@ class TubeplusResolver(Plugin, UrlResolver):
     def get_media_url(self, web_url):
         #get list
         try:
-            html = self.net.http_GET(web_url).content
+            html = self.net.http_GET(web_url).body
         except urllib2.URLError, e:
             common.addon.log_error('tubeplus: got http error %d fetching %s' %
                                     (e.code, web_url))
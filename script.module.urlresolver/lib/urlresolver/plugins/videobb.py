@@ -29,7 +29,7 @@ class VideobbResolver(Plugin, UrlResolver, PluginSettings):
         json_url = 'http://videobb.com/player_control/settings.php?v=%s' % \
                                                                     video_id
         try:
-            json = self.net.http_GET(json_url).content
+            json = self.net.http_GET(json_url).body
         except urllib2.URLError, e:
             common.addon.log_error('videobb: got http error %d fetching %s' %
                                     (e.code, api_url))
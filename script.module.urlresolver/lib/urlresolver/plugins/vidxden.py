@@ -24,9 +24,12 @@ In testing there seems to be a timing issue with files coming up as not playable
 This happens on both the addon and in a browser.
 """
 
+import os
 import re
 import urllib2
 from t0mm0.common.net import Net
+from lib import jsunpack
+from lib import verified
 from urlresolver import common
 from urlresolver.plugnplay.interfaces import UrlResolver
 from urlresolver.plugnplay.interfaces import PluginSettings
@@ -35,6 +38,8 @@ from urlresolver.plugnplay import Plugin
 class VidxdenResolver(Plugin, UrlResolver, PluginSettings):
     implements = [UrlResolver, PluginSettings]
     name = "vidxden"
+    sessions = verified.SessionCache(os.path.join(common.profile_path,
+                                                  '%s.sessions' % name))
 
     def __init__(self):
         p = self.get_setting('priority') or 100
@@ -42,34 +47,52 @@ class VidxdenResolver(Plugin, UrlResolver, PluginSettings):
         self.net = Net()
 
     def get_media_url(self, web_url):
+        #skip the human verification if we've already passed it for this file
+        tokens = self.sessions.get(web_url)
+        if tokens:
+            try:
+                html = self.net.http_POST(tokens['post_url'], 
+                                          form_data=tokens['form']).body
+                stream_url = self._find_stream(html)
+                if stream_url:
+                    return stream_url
+            except urllib2.URLError, e:
+                pass
+            self.sessions.invalidate(web_url)
+
         """ Human Verification """
         try:
             resp = self.net.http_GET(web_url)
-            html = resp.content
+            html = resp.body
             post_url = resp.get_url()
 
             form_values = {}
             for i in re.finditer('<input name="(.+?)".+?value="(.+?)"', html):
                 form_values[i.group(1)] = i.group(2)
 
-            html = self.net.http_POST(post_url, form_data=form_values).content
+            html = self.net.http_POST(post_url, form_data=form_values).body
 
         except urllib2.URLError, e:
             common.addon.log_error('vidxden: got http error %d fetching %s' %
                                   (e.code, web_url))
             return False
         
+        stream_url = self._find_stream(html)
+        if stream_url:
+            self.sessions.put(web_url, post_url, {'post_url': post_url,
+                                                  'form': form_values})
+        return stream_url
+
+        
+    def _find_stream(self, html):
         #find packed javascript embed code     
-        r = re.search('return p}\(\'(.+?);\',\d+,\d+,\'(.+?)\'\.split',html)
-        if r:
-            p, k = r.groups()
-        else:
+        decrypted_data = jsunpack.unpack(html)
+        if not decrypted_data:
             common.addon.log_error('vidxden: packed javascript embed code not found')
-
-        decrypted_data = unpack_js(p, k)
+            return False
         
         #First checks for a flv url, then the if statement is for the avi url
-        r = re.search('file.\',.\'(.+?).\'', decrypted_data)
+        r = re.search('file\'\s*,\s*\'(.+?)\'', decrypted_data)
         if not r:
             r = re.search('src="(.+?)"', decrypted_data)
         if r:
@@ -84,36 +107,3 @@ class VidxdenResolver(Plugin, UrlResolver, PluginSettings):
     def valid_url(self, web_url):
         return re.match('http://(?:www.)?(vidxden|divxden|vidbux).com/' +
                         '(embed-)?[0-9a-z]+', web_url)
-        
-        
-def unpack_js(p, k):
-    '''emulate js unpacking code'''
-    k = k.split('|')
-    for x in range(len(k) - 1, -1, -1):
-        if k[x]:
-            p = re.sub('\\b%s\\b' % base36encode(x), k[x], p)
-    return p
-
-
-def base36encode(number, alphabet='0123456789abcdefghijklmnopqrstuvwxyz'):
-    """Convert positive integer to a base36 string. (from wikipedia)"""
-    if not isinstance(number, (int, long)):
-        raise TypeError('number must be an integer')
- 
-    # Special case for zero
-    if number == 0:
-        return alphabet[0]
-
-    base36 = ''
-
-    sign = ''
-    if number < 0:
-        sign = '-'
-        number = - number
-
-    while number != 0:
-        number, i = divmod(number, len(alphabet))
-        base36 = alphabet[i] + base36
-
-    return sign + base36
-
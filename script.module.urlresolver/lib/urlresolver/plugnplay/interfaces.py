@@ -38,6 +38,7 @@ import urlresolver
 from urlresolver import common
 from urlresolver.plugnplay import Interface
 import sys
+import time
 
 def _function_id(obj, nFramesUp):
 	'''Create a string naming the function n frames up on the stack.'''
@@ -179,6 +180,18 @@ class SiteAuth(Interface):
     Your plugin should implement this interface if the file hoster you are 
     resolving URLs for requires authentication. You may also implement it if
     the file hoster supports authentication but doesn't require it.
+    
+    Before resolving, :func:`urlresolver.resolve` calls :meth:`login` only if
+    :meth:`is_logged_in` returns ``False``. Only one login per plugin happens
+    at a time, and resolves which were waiting for it use the new session
+    rather than logging in again.
+    '''
+    
+    session_expires = 0
+    '''
+    (float) Time (as returned by :func:`time.time`) at which the current 
+    session stops being valid. Set this in :meth:`login` if you know how long
+    a login lasts.
     '''
 
 
@@ -189,6 +202,23 @@ class SiteAuth(Interface):
         to a web page which will set cookies. 
         '''
         not_implemented(self)
+        
+        
+    def is_logged_in(self):
+        '''
+        Check whether there is already a valid session with the file hoster,
+        without contacting it if possible (eg. by checking whether the login
+        cookie has expired).
+        
+        The default implementation returns ``True`` until 
+        :attr:`session_expires`, so if you don't override this method or set
+        :attr:`session_expires`, :meth:`login` is called before every 
+        resolve.
+        
+        Returns:
+            ``True`` if :meth:`login` doesn't need to be called.
+        '''
+        return time.time() < self.session_expires
 
 
 
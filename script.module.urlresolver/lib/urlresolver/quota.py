@@ -0,0 +1,143 @@
+#    urlresolver XBMC Addon
+#    Copyright (C) 2011 t0mm0
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Keeps track of file hosters which have told us our account can't download
+any more for now, and of which account tier we have with each hoster.
+
+Resolver plugins record what they find out::
+
+    from urlresolver import quota
+    quota.set_limited(self.name)
+    quota.set_tier(self.name, 'free')
+
+and :func:`urlresolver.find_resolver` and :func:`urlresolver.choose_source`
+use it to try throttled hosters last. Everything is saved in the addon
+profile directory so it is remembered between plays.
+'''
+
+import os
+import threading
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from urlresolver import common
+
+LIMIT_TTL = 3600
+'''Default number of seconds a download limit is assumed to last.'''
+
+TIER_TTL = 86400
+'''Default number of seconds an account tier is remembered for.'''
+
+_lock = threading.Lock()
+_hosters = None
+
+
+def set_limited(hoster, ttl=LIMIT_TTL):
+    '''
+    Record that a hoster said our download limit has been reached.
+
+    Args:
+        hoster (str): The :attr:`UrlResolver.name` of the plugin.
+
+    Kwargs:
+        ttl (int): Number of seconds until the limit is expected to reset.
+    '''
+    _update(hoster, limited_until=time.time() + ttl)
+
+
+def is_limited(hoster):
+    '''Returns ``True`` if the hoster's download limit was reached recently.'''
+    return _get(hoster).get('limited_until', 0) > time.time()
+
+
+def set_tier(hoster, tier, ttl=TIER_TTL):
+    '''
+    Record which kind of account we have with a hoster.
+
+    Args:
+        hoster (str): The :attr:`UrlResolver.name` of the plugin.
+
+        tier (str): Eg. ``'premium'``, ``'free'`` or ``None`` if not logged
+        in.
+
+    Kwargs:
+        ttl (int): Number of seconds to remember the tier for.
+    '''
+    _update(hoster, tier=tier, tier_until=time.time() + ttl)
+
+
+def get_tier(hoster):
+    '''
+    Returns the last account tier recorded for a hoster, or ``None`` if it
+    isn't known (or has expired).
+    '''
+    info = _get(hoster)
+    if info.get('tier_until', 0) > time.time():
+        return info.get('tier')
+    return None
+
+
+def _get(hoster):
+    _lock.acquire()
+    try:
+        return dict(_load().get(hoster, {}))
+    finally:
+        _lock.release()
+
+
+def _update(hoster, **values):
+    _lock.acquire()
+    try:
+        hosters = _load()
+        hosters.setdefault(hoster, {}).update(values)
+        now = time.time()
+        for name, info in hosters.items():
+            if (info.get('limited_until', 0) < now and
+                info.get('tier_until', 0) < now):
+                del hosters[name]
+        try:
+            try:
+                os.makedirs(os.path.dirname(common.quota_file))
+            except OSError:
+                pass
+            f = open(common.quota_file, 'w')
+            try:
+                json.dump(hosters, f)
+            finally:
+                f.close()
+        except IOError:
+            common.addon.log_error('error writing ' + common.quota_file)
+    finally:
+        _lock.release()
+
+
+def _load():
+    '''Returns the saved state, reading it the first time. Call with _lock.'''
+    global _hosters
+    if _hosters is None:
+        _hosters = {}
+        try:
+            f = open(common.quota_file)
+            try:
+                _hosters = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            pass
+    return _hosters